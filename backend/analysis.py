@@ -1,6 +1,5 @@
 import subprocess
 import tempfile
-import hashlib
 from pathlib import Path
 from typing import List, Tuple, Optional
 
@@ -9,6 +8,7 @@ import numpy as np
 import soundfile as sf
 import torch
 import gc
+import threading
 
 # Configure torch for CPU efficiency
 import multiprocessing
@@ -18,6 +18,8 @@ torch.set_num_threads(num_cores)
 # Global model cache to avoid reloading from disk on every request
 _DEMUCS_WRAPPER = None
 _DEMUCS_6STEM_WRAPPER = None
+# Guards first-time model loads so two concurrent requests never both load a model
+_MODEL_LOAD_LOCK = threading.Lock()
 
 # Stem types for 6-stem separation (htdemucs_6s model)
 STEM_TYPES = ["vocals", "drums", "bass", "guitar", "piano", "other"]
@@ -64,7 +66,9 @@ class DemucsSeparator:
 def _get_separator():
     global _DEMUCS_WRAPPER
     if _DEMUCS_WRAPPER is None:
-        _DEMUCS_WRAPPER = DemucsSeparator()
+        with _MODEL_LOAD_LOCK:
+            if _DEMUCS_WRAPPER is None:
+                _DEMUCS_WRAPPER = DemucsSeparator()
     return _DEMUCS_WRAPPER
 
 
@@ -115,7 +119,9 @@ def _get_separator_6stem():
     """Get or create the 6-stem separator instance."""
     global _DEMUCS_6STEM_WRAPPER
     if _DEMUCS_6STEM_WRAPPER is None:
-        _DEMUCS_6STEM_WRAPPER = DemucsSeparator6Stem()
+        with _MODEL_LOAD_LOCK:
+            if _DEMUCS_6STEM_WRAPPER is None:
+                _DEMUCS_6STEM_WRAPPER = DemucsSeparator6Stem()
     return _DEMUCS_6STEM_WRAPPER
 
 
@@ -183,25 +189,6 @@ for root in range(12):
         CHORD_TEMPLATES.append((chord_name, v / (norm + 1e-9)))
 
 
-def get_file_hash(file_path: Path) -> str:
-    """Generate MD5 hash based on file content and size for robust caching."""
-    hasher = hashlib.md5()
-    try:
-        stats = file_path.stat()
-        hasher.update(str(stats.st_size).encode())
-        with open(file_path, 'rb') as f:
-            chunk = f.read(1024 * 1024)
-            hasher.update(chunk)
-            if stats.st_size > 2 * 1024 * 1024:
-                f.seek(-1024 * 1024, 2)
-                chunk = f.read(1024 * 1024)
-                hasher.update(chunk)
-        return hasher.hexdigest()
-    except Exception as e:
-        print(f"[Analysis] Hashing failed: {e}")
-        return hashlib.md5(str(file_path.name).encode()).hexdigest()
-
-
 def _ffmpeg_to_wav(src: Path, dst: Path):
     subprocess.run(
         ["ffmpeg", "-y", "-i", str(src), "-ac", "1", "-ar", "44100", str(dst)],
@@ -1,7 +1,10 @@
 from pathlib import Path
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form, WebSocket
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, WebSocket, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import ORJSONResponse, FileResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+import asyncio
+import importlib.util
 import tempfile
 import shutil
 import uuid
@@ -10,15 +13,20 @@ import time
 import os
 import json
 import threading
+import heapq
+import hashlib
 import socket
 import httpx
 import dns.resolver
+from collections import OrderedDict
+from email.utils import formatdate
+from urllib.parse import quote
 from contextlib import asynccontextmanager
 import uvicorn
 
-from analysis import analyze_file, separate_audio_full, separate_audio_stems, STEM_TYPES, _get_separator_6stem, get_file_hash
+from analysis import analyze_file, separate_audio_full, separate_audio_stems, STEM_TYPES, _get_separator_6stem
 from websocket_chords import websocket_chord_endpoint
-from youtube import extract_audio, get_video_info, check_rate_limit, get_remaining_requests, extract_video_id
+from youtube import extract_audio_async, get_video_info, check_rate_limit, get_remaining_requests, extract_video_id, rate_limit_sweep_loop, download_cleanup_loop
 
 # Try to import madmom, but don't fail if it's not available
 try:
@@ -31,15 +39,33 @@ except ImportError:
     MADMOM_AVAILABLE = False
     print("[Startup] [INFO] madmom module not found - using librosa engine only")
 
+# Shared HTTP client: keeps TCP/TLS connections alive across outbound calls
+# instead of paying a fresh handshake for every request. Lives as long as the
+# process (it is already used at import), so lifespan never closes it.
+HTTPX_CLIENT = httpx.Client(
+    http2=True,
+    timeout=10.0,
+    follow_redirects=True,
+    limits=httpx.Limits(max_keepalive_connections=20),
+)
+
 # --- NETWORK DIAGNOSTICS & PATCH ---
 # --- NETWORK DIAGNOSTICS & PATCH ---
 print("\n[DIAG] Starting Network Diagnostics (v1.9.4)...")
 
+# Resolver pinned to Google DNS. Lookups run inline on the caller's thread (a
+# pool would only queue them behind each other while the caller still waits),
+# and the resolver's lifetime bounds them so no caller waits on a stuck query.
+YOUTUBE_HOSTS = {"www.youtube.com", "youtube.com", "music.youtube.com"}
+DNS_LIFETIME = 3.0
+
+res = dns.resolver.Resolver(configure=False)
+res.nameservers = ['8.8.8.8', '8.8.4.4']
+res.lifetime = DNS_LIFETIME
+
 # 1. Test Upstream DNS (Google) directly
 try:
     print("[DIAG] Testing direct query to 8.8.8.8...")
-    res = dns.resolver.Resolver()
-    res.nameservers = ['8.8.8.8', '8.8.4.4']
     ans = res.resolve('www.youtube.com', 'A')
     print(f"[DIAG] [OK] dnspython Success: {ans[0].to_text()}")
     DNS_BYPASS_POSSIBLE = True
@@ -48,6 +74,53 @@ except Exception as e:
     DNS_BYPASS_POSSIBLE = False
 
 # 2. Apply Monkey Patches
+# Pinned YouTube addresses: { host: (ip, expires_at) }. Filled at startup and
+# refreshed ahead of expiry by _refresh_dns_loop, so socket calls are a dict lookup.
+_dns_cache: dict[str, tuple[str, float]] = {}
+DNS_REFRESH_MARGIN = 60  # seconds before expiry to re-resolve
+DNS_MIN_REFRESH_INTERVAL = 30
+# Google DNS hands out the remaining cached TTL, often shorter than the refresh
+# interval, so a pinned IP keeps being served this long past expiry while the
+# background refresh catches up; only beyond that does a request resolve inline
+DNS_MAX_STALE = 300
+
+
+def _query_youtube_host(host):
+    """Resolve a YouTube hostname via 8.8.8.8 and pin the result."""
+    answers = res.resolve(host, 'A')
+    ip = answers[0].to_text()
+    _dns_cache[host] = (ip, time.time() + answers.rrset.ttl)
+    return ip
+
+
+def _resolve_youtube_host(host):
+    """Return the pinned IP for a YouTube hostname, querying only if it is long expired."""
+    entry = _dns_cache.get(host)
+    if entry and entry[1] + DNS_MAX_STALE > time.time():
+        return entry[0]
+    return _query_youtube_host(host)
+
+
+def _prewarm_dns():
+    for host in YOUTUBE_HOSTS:
+        try:
+            _query_youtube_host(host)
+        except Exception as e:
+            print(f"[DNS] [WARNING] Could not pre-resolve {host}: {e}")
+
+
+async def _refresh_dns_loop():
+    """Re-resolve pinned YouTube hosts shortly before their TTL runs out."""
+    while True:
+        expiries = [expires_at for _, expires_at in _dns_cache.values()]
+        if expiries:
+            delay = min(expiries) - time.time() - DNS_REFRESH_MARGIN
+        else:
+            delay = DNS_REFRESH_MARGIN
+        await asyncio.sleep(max(delay, DNS_MIN_REFRESH_INTERVAL))
+        await asyncio.to_thread(_prewarm_dns)
+
+
 try:
     print("[DNS] [PATCH] Patching socket..." if DNS_BYPASS_POSSIBLE else "[DNS] [WARNING] Applying patch anyway...")
     
@@ -56,11 +129,10 @@ try:
 
     def patched_getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
         # Only patch YouTube domains to bypass potential system-level poisoning/blocking
-        if host == "www.youtube.com" or host == "youtube.com" or host == "music.youtube.com":
+        if host in YOUTUBE_HOSTS:
             try:
                 # Use dnspython to query 8.8.8.8 directly
-                answers = res.resolve(host, 'A')
-                ip = answers[0].to_text()
+                ip = _resolve_youtube_host(host)
                 # print(f"[DNS Patch] Resolved {host} -> {ip}")
                 return _original_getaddrinfo(ip, port, family, type, proto, flags)
             except Exception:
@@ -70,10 +142,9 @@ try:
         return _original_getaddrinfo(host, port, family, type, proto, flags)
 
     def patched_gethostbyname(hostname):
-        if hostname == "www.youtube.com" or hostname == "youtube.com" or hostname == "music.youtube.com":
+        if hostname in YOUTUBE_HOSTS:
             try:
-                answers = res.resolve(hostname, 'A')
-                return answers[0].to_text()
+                return _resolve_youtube_host(hostname)
             except Exception:
                 pass
         return _original_gethostbyname(hostname)
@@ -95,8 +166,8 @@ except Exception as e:
 
 try:
     target = "www.youtube.com"
-    print(f"[DIAG] Testing httpx.get('https://{target}')...")
-    response = httpx.get(f"https://{target}", timeout=10.0, follow_redirects=True)
+    print(f"[DIAG] Testing HTTPX_CLIENT.get('https://{target}')...")
+    response = HTTPX_CLIENT.get(f"https://{target}")
     print(f"[DIAG] [OK] HTTPS Result: {response.status_code}")
 except Exception as e:
     print(f"[DIAG] [ERROR] HTTPS FAILED: {e}")
@@ -112,6 +183,27 @@ STEMS_CACHE_DIR = Path("cache/stems")
 for cache_dir in [ANALYSIS_CACHE_DIR, STEMS_CACHE_DIR]:
     cache_dir.mkdir(parents=True, exist_ok=True)
 
+# Uploads are transient and read once by the analysis pipeline, so keep them on
+# tmpfs when there is room. Container /dev/shm is often small (64 MB by default
+# in Docker), so fall back to the regular temp dir for anything that would take
+# more than half of the free space. Demucs writes its stems next to the input,
+# so uploads that get separated always stay on disk.
+TMPFS_DIR = Path("/dev/shm")
+
+
+def upload_tmp_dir(size_hint, will_separate: bool = False) -> str | None:
+    """Return a tmpfs directory for an upload of size_hint bytes, or None for the default."""
+    if will_separate or not size_hint or not TMPFS_DIR.is_dir():
+        return None
+    try:
+        st = os.statvfs(TMPFS_DIR)
+    except OSError:
+        return None
+    if size_hint > (st.f_bavail * st.f_frsize) // 2:
+        return None
+    return str(TMPFS_DIR)
+
+
 # Store separated audio files temporarily (in production, use S3/cloud storage)
 # Format: { id: {"paths": [path1, path2], "timestamp": float} }
 separated_files = {}
@@ -121,18 +213,38 @@ separated_files = {}
 MAX_CONCURRENT_ANALYSIS = 2
 analysis_semaphore = threading.Semaphore(MAX_CONCURRENT_ANALYSIS)
 
+# Expiry queue for separated_files: (expires_at, file_id) min-heap. The cleanup
+# thread sleeps until the earliest expiry instead of rescanning every entry.
+FILE_TTL_SECONDS = 3600
+_expiry_heap: list[tuple[float, str]] = []
+_expiry_cond = threading.Condition()
+
+
+def register_file(file_id: str, info: dict):
+    """Store a downloadable file entry and schedule its expiry."""
+    with _expiry_cond:
+        separated_files[file_id] = info
+        heapq.heappush(_expiry_heap, (info["timestamp"] + FILE_TTL_SECONDS, file_id))
+        _expiry_cond.notify()
+
+
 def cleanup_loop():
-    """Background thread to clean up old files after 1 hour."""
+    """Background thread to clean up files as soon as they are 1 hour old."""
     while True:
         try:
-            now = time.time()
-            to_delete = []
-            for fid, info in separated_files.items():
-                if now - info.get("timestamp", 0) > 3600: # 1 hour
-                    to_delete.append(fid)
-            
-            for fid in to_delete:
-                info = separated_files.pop(fid, {})
+            expired = []
+            with _expiry_cond:
+                while not _expiry_heap or _expiry_heap[0][0] > time.time():
+                    timeout = _expiry_heap[0][0] - time.time() if _expiry_heap else None
+                    _expiry_cond.wait(timeout=timeout)
+
+                now = time.time()
+                while _expiry_heap and _expiry_heap[0][0] <= now:
+                    _, fid = heapq.heappop(_expiry_heap)
+                    expired.append((fid, separated_files.pop(fid, {})))
+
+            # Delete outside the lock so new registrations are never blocked on disk I/O
+            for fid, info in expired:
                 if info.get("preserve_paths", False):
                     print(f"[Cleanup] Preserving cached paths for session: {fid}")
                     continue
@@ -146,7 +258,121 @@ def cleanup_loop():
                         print(f"[Cleanup] Error deleting {p}: {e}")
         except Exception as e:
             print(f"[Cleanup] Error in loop: {e}")
-        time.sleep(600) # Run every 10 minutes
+            time.sleep(1)
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = 100 * 1024 * 1024  # 100 MB
+# Browsers report a variety of audio types (including the non-standard "audio/mp3"),
+# and some clients fall back to a generic binary type for unknown extensions.
+GENERIC_UPLOAD_TYPES = {"application/octet-stream"}
+
+
+def validate_upload(file: UploadFile):
+    """Reject oversized or non-audio uploads before anything is written to disk."""
+    if file.size and file.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="File too large. Maximum size is 100 MB.")
+
+    content_type = (file.content_type or "").split(";")[0].strip().lower()
+    if content_type and not content_type.startswith("audio/") and content_type not in GENERIC_UPLOAD_TYPES:
+        raise HTTPException(status_code=415, detail=f"Unsupported file type: {content_type}")
+
+
+def spool_upload(file: UploadFile, dest) -> str:
+    """Copy an upload into dest, hashing it on the way. Returns the content digest.
+
+    The size limit is enforced while copying too, since chunked clients may not
+    send a Content-Length up front.
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    written = 0
+    while chunk := file.file.read(UPLOAD_CHUNK_SIZE):
+        written += len(chunk)
+        if written > MAX_UPLOAD_BYTES:
+            dest.close()
+            Path(dest.name).unlink(missing_ok=True)
+            raise HTTPException(status_code=413, detail="File too large. Maximum size is 100 MB.")
+        hasher.update(chunk)
+        dest.write(chunk)
+    return hasher.hexdigest()
+
+
+# In-memory LRU in front of the on-disk analysis cache: { cache file name: result }
+ANALYSIS_MEMORY_CACHE_SIZE = 256
+_analysis_memory_cache: OrderedDict[str, dict] = OrderedDict()
+_analysis_cache_lock = threading.Lock()
+
+
+def _remember_analysis(key: str, result: dict):
+    with _analysis_cache_lock:
+        _analysis_memory_cache[key] = result
+        _analysis_memory_cache.move_to_end(key)
+        if len(_analysis_memory_cache) > ANALYSIS_MEMORY_CACHE_SIZE:
+            _analysis_memory_cache.popitem(last=False)
+
+
+def load_cached_analysis(cache_file: Path, separate_vocals: bool, inst_cache_dir: Path, file_type: str) -> dict | None:
+    """Return a cached analysis result ready to send, or None on a miss.
+
+    When vocal separation was requested the cached instrumental track is
+    registered for download; if it has gone missing the entry is treated as a miss.
+    """
+    key = cache_file.name
+    try:
+        with _analysis_cache_lock:
+            cached = _analysis_memory_cache.get(key)
+            if cached is not None:
+                _analysis_memory_cache.move_to_end(key)
+
+        if cached is None:
+            if not cache_file.exists():
+                return None
+            with open(cache_file, "r") as f:
+                cached = json.load(f)
+            _remember_analysis(key, cached)
+
+        print(f"[API] Cache hit for analysis: {key}")
+        result = dict(cached)
+
+        # If vocal separation was used, we need to serve the cached instrumental track
+        if separate_vocals:
+            cached_inst_path = inst_cache_dir / "instrumental.wav"
+            if not cached_inst_path.exists():
+                print("[API] Cached instrumental file not found, forcing re-analysis")
+                return None
+            file_id = str(uuid.uuid4())
+            register_file(file_id, {
+                "paths": [str(cached_inst_path)],
+                "timestamp": time.time(),
+                "type": file_type,
+                "preserve_paths": True # Protect cache from deletion
+            })
+            result["instrumentalUrl"] = f"/api/analyze/download/{file_id}/instrumental.wav"
+            print(f"[API] Registered cached instrumental file with ID: {file_id}")
+
+        return result
+    except Exception as e:
+        print(f"[API] Error reading cache or cached files missing, running analysis: {e}")
+        return None
+
+
+def save_cached_analysis(cache_file: Path, result: dict, inst_cache_dir: Path):
+    """Persist an analysis result (and its instrumental track, if any) to the cache."""
+    try:
+        cache_result = result.copy()
+        if "instrumentalPath" in result:
+            inst_cache_dir.mkdir(parents=True, exist_ok=True)
+            cached_inst_path = inst_cache_dir / "instrumental.wav"
+            shutil.copy2(result["instrumentalPath"], cached_inst_path)
+            print(f"[API] Cached instrumental file to {cached_inst_path}")
+            del cache_result["instrumentalPath"]
+
+        with open(cache_file, "w") as f:
+            json.dump(cache_result, f)
+        _remember_analysis(cache_file.name, cache_result)
+        print(f"[API] Saved analysis result to cache: {cache_file.name}")
+    except Exception as e:
+        print(f"[API] Failed to save analysis result to cache: {e}")
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -154,15 +380,16 @@ async def lifespan(app: FastAPI):
     print("[Startup] Preloading models...")
     try:
         from analysis import _get_separator
-        # This will load the 2-stem model into memory
-        _get_separator()
+        # This will load the 2-stem model into memory. Keeping it on app.state
+        # pins the shared instance for the lifetime of the process.
+        app.state.separator = _get_separator()
         print("[Startup] [OK] 2-stem (htdemucs) model preloaded")
     except Exception as e:
         print(f"[Startup] [WARNING] 2-stem model preload failed: {e}")
     
     try:
         # Also preload the 6-stem model
-        _get_separator_6stem()
+        app.state.separator_6stem = _get_separator_6stem()
         print("[Startup] [OK] 6-stem (htdemucs_6s) model preloaded")
     except Exception as e:
         print(f"[Startup] [WARNING] 6-stem model preload failed: {e}")
@@ -171,9 +398,24 @@ async def lifespan(app: FastAPI):
     thread = threading.Thread(target=cleanup_loop, daemon=True)
     thread.start()
     print("[Startup] [OK] Cleanup thread started")
+
+    # Drop rate-limit state for IPs that stopped sending requests
+    threading.Thread(target=rate_limit_sweep_loop, daemon=True).start()
+
+    # Expire old YouTube downloads and anything a crash left in the scratch dir
+    threading.Thread(target=download_cleanup_loop, daemon=True).start()
+
+    # Pin YouTube DNS so request-time socket calls never wait on a lookup
+    await asyncio.to_thread(_prewarm_dns)
+    dns_refresh_task = asyncio.create_task(_refresh_dns_loop())
+    print(f"[Startup] [OK] Pinned DNS for {len(_dns_cache)} YouTube hosts")
     yield
+    # HTTPX_CLIENT is module-level and outlives any one lifespan (the app may
+    # be started again in the same process), so only the refresh task is
+    # torn down here
+    dns_refresh_task.cancel()
 
-app = FastAPI(title="Chord AI Backend", version="1.3.4", lifespan=lifespan)
+app = FastAPI(title="Chord AI Backend", version="1.3.4", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -194,51 +436,29 @@ def analyze(file: UploadFile = File(...), separate_vocals: bool = Form(False), u
         use_madmom: If True, use fast madmom engine. If False, use librosa (detailed analysis)
     """
     print(f"Received analysis request for file: {file.filename} (separate_vocals={separate_vocals}, use_madmom={use_madmom})")
-    
-    # Acquire semaphore (queueing if busy)
-    with analysis_semaphore:
-        try:
-            if not file.filename:
-                raise HTTPException(status_code=400, detail="File required")
 
-            suffix = Path(file.filename).suffix or ".tmp"
+    if not file.filename:
+        raise HTTPException(status_code=400, detail="File required")
+
+    validate_upload(file)
+    suffix = Path(file.filename).suffix or ".tmp"
 
-            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-                shutil.copyfileobj(file.file, tmp)
-                tmp_path = Path(tmp.name)
-        
-            try:
-                # Check cache first
-                file_hash = get_file_hash(tmp_path)
-                cache_file = ANALYSIS_CACHE_DIR / f"{file_hash}_{separate_vocals}_{use_madmom}.json"
-                
-                if cache_file.exists():
-                    print(f"[API] Cache hit for analysis: {cache_file.name}")
-                    try:
-                        with open(cache_file, "r") as f:
-                            result = json.load(f)
-                        
-                        # If vocal separation was used, we need to serve the cached instrumental track
-                        if separate_vocals:
-                            cached_inst_path = STEMS_CACHE_DIR / file_hash / "instrumental.wav"
-                            if cached_inst_path.exists():
-                                file_id = str(uuid.uuid4())
-                                separated_files[file_id] = {
-                                    "paths": [str(cached_inst_path)],
-                                    "timestamp": time.time(),
-                                    "type": "analysis",
-                                    "preserve_paths": True # Protect cache from deletion
-                                }
-                                result["instrumentalUrl"] = f"/api/analyze/download/{file_id}/instrumental.wav"
-                                print(f"[API] Registered cached instrumental file with ID: {file_id}")
-                            else:
-                                print("[API] Cached instrumental file not found, forcing re-analysis")
-                                raise FileNotFoundError("Cached instrumental file missing")
-                        
-                        return JSONResponse(result)
-                    except Exception as e:
-                        print(f"[API] Error reading cache or cached files missing, running analysis: {e}")
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=upload_tmp_dir(file.size, separate_vocals)) as tmp:
+        file_hash = spool_upload(file, tmp)
+        tmp_path = Path(tmp.name)
+
+    try:
+        # Check cache first - identical uploads don't need an analysis slot
+        cache_file = ANALYSIS_CACHE_DIR / f"{file_hash}_{separate_vocals}_{use_madmom}.json"
+        inst_cache_dir = STEMS_CACHE_DIR / file_hash
+
+        result = load_cached_analysis(cache_file, separate_vocals, inst_cache_dir, "analysis")
+        if result is not None:
+            return ORJSONResponse(result)
 
+        # Acquire semaphore (queueing if busy)
+        with analysis_semaphore:
+            try:
                 # The 'use_madmom' flag is the primary engine selector (Fast vs Detailed)
                 if not use_madmom:
                     # User wants MORE ACCURATE -> Force Librosa
@@ -256,54 +476,52 @@ def analyze(file: UploadFile = File(...), separate_vocals: bool = Form(False), u
                     # Fallback
                     print("[API] Engine: LIBROSA (Fallback) | Madmom not found")
                     result = analyze_file(tmp_path, separate_vocals=False)
-                
-                # Save to cache
-                try:
-                    cache_result = result.copy()
-                    if "instrumentalPath" in result:
-                        inst_cache_dir = STEMS_CACHE_DIR / file_hash
-                        inst_cache_dir.mkdir(parents=True, exist_ok=True)
-                        cached_inst_path = inst_cache_dir / "instrumental.wav"
-                        shutil.copy2(result["instrumentalPath"], cached_inst_path)
-                        print(f"[API] Cached instrumental file to {cached_inst_path}")
-                        
-                        if "instrumentalPath" in cache_result:
-                            del cache_result["instrumentalPath"]
-                    
-                    with open(cache_file, "w") as f:
-                        json.dump(cache_result, f)
-                    print(f"[API] Saved analysis result to cache: {cache_file.name}")
-                except Exception as e:
-                    print(f"[API] Failed to save analysis result to cache: {e}")
+
+                save_cached_analysis(cache_file, result, inst_cache_dir)
 
                 # If vocal separation was used, store the instrumental file and return its URL
                 if "instrumentalPath" in result:
                     file_id = str(uuid.uuid4())
                     path = result["instrumentalPath"]
-                    separated_files[file_id] = {
+                    register_file(file_id, {
                         "paths": [path],
                         "timestamp": time.time(),
                         "type": "analysis"
-                    }
+                    })
                     result["instrumentalUrl"] = f"/api/analyze/download/{file_id}/instrumental.wav"
                     print(f"Stored instrumental file with ID: {file_id}, URL: {result['instrumentalUrl']}")
                     del result["instrumentalPath"]  # Remove the local path from response
-                
+
                 print(f"Returning result with keys: {result.keys()}")
-                return JSONResponse(result)
+                return ORJSONResponse(result)
             except Exception: 
                 print("[API] Analysis failed")
                 raise HTTPException(status_code=500, detail="Analysis failed")
-        finally:
-            try:
-                if 'tmp_path' in locals():
-                    tmp_path.unlink(missing_ok=True)
-            except Exception:
-                pass
+    finally:
+        try:
+            tmp_path.unlink(missing_ok=True)
+        except Exception:
+            pass
+
+
+# Reverse proxies in front of the app (the Space's edge), each of which appends
+# the address it saw to X-Forwarded-For. Anything left of those is client-written.
+TRUSTED_PROXY_HOPS = int(os.environ.get("TRUSTED_PROXY_HOPS", "1"))
+
+
+def _peer_ip(request: Request) -> str:
+    """Address of the caller as seen by the outermost trusted proxy, else the socket peer."""
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded and TRUSTED_PROXY_HOPS > 0:
+        hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+        if len(hops) >= TRUSTED_PROXY_HOPS:
+            return hops[-TRUSTED_PROXY_HOPS]
+    return request.client.host if request.client else "unknown"
 
 
 @app.post("/api/analyze-youtube")
-def analyze_youtube(
+async def analyze_youtube(
+    request: Request,
     url: str = Form(...),
     separate_vocals: bool = Form(False),
     use_madmom: bool = Form(True),
@@ -335,20 +553,45 @@ def analyze_youtube(
     if not video_id:
         raise HTTPException(status_code=400, detail="Invalid YouTube URL")
     
-    # Acquire semaphore (queueing if busy)
-    with analysis_semaphore:
-        try:
-            # Extract audio from YouTube
-            print(f"[YouTube] Extracting audio for video: {video_id}")
-            audio_info = extract_audio(url)
-            audio_path = Path(audio_info['audio_path'])
-            
-            if not audio_path.exists():
-                raise HTTPException(status_code=500, detail="Failed to download audio")
-            
-            print(f"[YouTube] Audio extracted: {audio_path} (cached: {audio_info.get('cached', False)})")
-            
-            # Analyze the audio
+    try:
+        # Extract audio from YouTube in a worker thread (gated per peer address,
+        # the client_ip form field is not trustworthy enough to share a gate on)
+        print(f"[YouTube] Extracting audio for video: {video_id}")
+        audio_info = await extract_audio_async(url, _peer_ip(request))
+        return await run_in_threadpool(
+            _analyze_youtube_audio, audio_info, video_id, separate_vocals, use_madmom, client_ip
+        )
+    except HTTPException:
+        raise
+    except Exception as exc:
+        print(f"[YouTube] Analysis failed: {exc}")
+        raise HTTPException(status_code=500, detail=f"YouTube analysis failed: {exc}")
+
+
+def _analyze_youtube_audio(
+    audio_info: dict,
+    video_id: str,
+    separate_vocals: bool,
+    use_madmom: bool,
+    client_ip: str,
+):
+    """Blocking half of analyze_youtube: cache lookup, analysis and file registration."""
+    audio_path = Path(audio_info['audio_path'])
+    
+    if not audio_path.exists():
+        raise HTTPException(status_code=500, detail="Failed to download audio")
+    
+    print(f"[YouTube] Audio extracted: {audio_path} (cached: {audio_info.get('cached', False)})")
+    
+    # Videos are immutable, so the analysis is cached by video ID
+    cache_file = ANALYSIS_CACHE_DIR / f"yt_{video_id}_{separate_vocals}_{use_madmom}.json"
+    inst_cache_dir = STEMS_CACHE_DIR / f"yt_{video_id}"
+    result = load_cached_analysis(cache_file, separate_vocals, inst_cache_dir, "youtube_analysis")
+
+    if result is None:
+        # Acquire semaphore (queueing if busy) - only the analysis itself
+        # needs a slot, the download above is network-bound
+        with analysis_semaphore:
             print(f"[YouTube] Starting analysis (madmom={use_madmom}, vocals={separate_vocals})")
             if not use_madmom:
                 result = analyze_file(audio_path, separate_vocals=separate_vocals)
@@ -358,46 +601,42 @@ def analyze_youtube(
                 result = analyze_file_madmom(audio_path)
             else:
                 result = analyze_file(audio_path, separate_vocals=False)
-            
-            # Handle instrumental file if vocal separation was used
-            if "instrumentalPath" in result:
-                file_id = str(uuid.uuid4())
-                path = result["instrumentalPath"]
-                separated_files[file_id] = {
-                    "paths": [path],
-                    "timestamp": time.time(),
-                    "type": "youtube_analysis"
-                }
-                result["instrumentalUrl"] = f"/api/analyze/download/{file_id}/instrumental.wav"
-                del result["instrumentalPath"]
-                
-            # Register the original audio file for download (for waveform visualization)
-            audio_id = str(uuid.uuid4())
-            separated_files[audio_id] = {
-                "paths": [str(audio_path)],
-                "timestamp": time.time(),
-                "type": "youtube_audio"
-            }
-            result["audioUrl"] = f"/api/analyze/download/{audio_id}/original.mp3"
-            
-            # Add YouTube video metadata
-            result["youtube"] = {
-                "videoId": audio_info['video_id'],
-                "title": audio_info['title'],
-                "duration": audio_info['duration'],
-                "thumbnail": audio_info['thumbnail'],
-                "channel": audio_info.get('channel', 'Unknown'),
-            }
-            result["remainingRequests"] = get_remaining_requests(client_ip)
-            
-            print(f"[YouTube] Analysis complete for: {audio_info['title']}")
-            return JSONResponse(result)
-            
-        except HTTPException:
-            raise
-        except Exception as exc:
-            print(f"[YouTube] Analysis failed: {exc}")
-            raise HTTPException(status_code=500, detail=f"YouTube analysis failed: {exc}")
+
+        save_cached_analysis(cache_file, result, inst_cache_dir)
+    
+    # Handle instrumental file if vocal separation was used
+    if "instrumentalPath" in result:
+        file_id = str(uuid.uuid4())
+        path = result["instrumentalPath"]
+        register_file(file_id, {
+            "paths": [path],
+            "timestamp": time.time(),
+            "type": "youtube_analysis"
+        })
+        result["instrumentalUrl"] = f"/api/analyze/download/{file_id}/instrumental.wav"
+        del result["instrumentalPath"]
+        
+    # Register the original audio file for download (for waveform visualization)
+    audio_id = str(uuid.uuid4())
+    register_file(audio_id, {
+        "paths": [str(audio_path)],
+        "timestamp": time.time(),
+        "type": "youtube_audio"
+    })
+    result["audioUrl"] = f"/api/analyze/download/{audio_id}/original.mp3"
+    
+    # Add YouTube video metadata
+    result["youtube"] = {
+        "videoId": audio_info['video_id'],
+        "title": audio_info['title'],
+        "duration": audio_info['duration'],
+        "thumbnail": audio_info['thumbnail'],
+        "channel": audio_info.get('channel', 'Unknown'),
+    }
+    result["remainingRequests"] = get_remaining_requests(client_ip)
+    
+    print(f"[YouTube] Analysis complete for: {audio_info['title']}")
+    return ORJSONResponse(result)
 
 
 @app.get("/api/youtube/info")
@@ -412,7 +651,7 @@ def youtube_info(url: str):
     """
     try:
         info = get_video_info(url)
-        return JSONResponse(info)
+        return ORJSONResponse(info)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -442,17 +681,17 @@ def separate_audio(
     if format not in {"wav", "mp3"}:
         raise HTTPException(status_code=400, detail="Invalid format. Use 'wav' or 'mp3'.")
 
+    validate_upload(file)
     suffix = Path(file.filename).suffix or ".tmp"
     
     # Acquire semaphore (queueing if busy)
     with analysis_semaphore:
         with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            shutil.copyfileobj(file.file, tmp)
+            file_hash = spool_upload(file, tmp)
             tmp_path = Path(tmp.name)
 
         try:
             # Check cache
-            file_hash = get_file_hash(tmp_path)
             cached_vocals_wav = STEMS_CACHE_DIR / file_hash / "vocals.wav"
             cached_inst_wav = STEMS_CACHE_DIR / file_hash / "instrumental.wav"
             
@@ -502,7 +741,7 @@ def separate_audio(
                 vocals_cache_path = STEMS_CACHE_DIR / file_hash / f"vocals.{format}"
                 inst_cache_path = STEMS_CACHE_DIR / file_hash / f"instrumental.{format}"
                 
-                separated_files[session_id] = {
+                register_file(session_id, {
                     "vocals": str(vocals_cache_path),
                     "instrumental": str(inst_cache_path),
                     "paths": [str(vocals_cache_path), str(inst_cache_path)],
@@ -510,9 +749,9 @@ def separate_audio(
                     "timestamp": time.time(),
                     "type": "separation",
                     "preserve_paths": True # Protect cache from deletion
-                }
+                })
                 
-                return JSONResponse(
+                return ORJSONResponse(
                     {
                         "session_id": session_id,
                         "format": format,
@@ -589,16 +828,16 @@ def separate_audio(
                 print(f"[API] Failed to cache separated stems: {e}")
 
             # Store paths temporarily
-            separated_files[session_id] = {
+            register_file(session_id, {
                 "vocals": str(vocals_path),
                 "instrumental": str(instrumental_path),
                 "paths": [str(vocals_path), str(instrumental_path)],
                 "format": format,
                 "timestamp": time.time(),
                 "type": "separation"
-            }
+            })
 
-            return JSONResponse(
+            return ORJSONResponse(
                 {
                     "session_id": session_id,
                     "format": format,
@@ -648,17 +887,17 @@ def separate_audio_6stems(
     if format not in {"wav", "mp3"}:
         raise HTTPException(status_code=400, detail="Invalid format. Use 'wav' or 'mp3'.")
 
+    validate_upload(file)
     suffix = Path(file.filename).suffix or ".tmp"
     
     # Acquire semaphore (queueing if busy)
     with analysis_semaphore:
         with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            shutil.copyfileobj(file.file, tmp)
+            file_hash = spool_upload(file, tmp)
             tmp_path = Path(tmp.name)
 
         try:
             # Check cache
-            file_hash = get_file_hash(tmp_path)
             dest_dir = STEMS_CACHE_DIR / file_hash
             
             has_all_stems = True
@@ -707,21 +946,21 @@ def separate_audio_6stems(
                     stem_data[stem_name] = str(cached_target)
                     all_paths.append(str(cached_target))
                     
-                separated_files[session_id] = {
+                register_file(session_id, {
                     **stem_data,
                     "paths": all_paths,
                     "format": format,
                     "timestamp": time.time(),
                     "type": "6stem-separation",
                     "preserve_paths": True # Protect cache from deletion
-                }
+                })
                 
                 stem_urls = {}
                 for stem_name in STEM_TYPES:
                     if stem_name in stem_data:
                         stem_urls[f"{stem_name}Url"] = f"/api/separate-stems/download/{session_id}/{stem_name}?format={format}"
                         
-                return JSONResponse(
+                return ORJSONResponse(
                     {
                         "session_id": session_id,
                         "format": format,
@@ -789,13 +1028,13 @@ def separate_audio_6stems(
                 print(f"[API] Failed to cache 6-stems: {e}")
 
             # Store paths temporarily
-            separated_files[session_id] = {
+            register_file(session_id, {
                 **stem_data,
                 "paths": all_paths,
                 "format": format,
                 "timestamp": time.time(),
                 "type": "6stem-separation"
-            }
+            })
 
             # Build response with download URLs for each stem
             stem_urls = {}
@@ -803,7 +1042,7 @@ def separate_audio_6stems(
                 if stem_name in stem_data:
                     stem_urls[f"{stem_name}Url"] = f"/api/separate-stems/download/{session_id}/{stem_name}?format={format}"
 
-            return JSONResponse(
+            return ORJSONResponse(
                 {
                     "session_id": session_id,
                     "format": format,
@@ -826,8 +1065,150 @@ def separate_audio_6stems(
                 pass
 
 
-@app.get("/api/separate-stems/download/{session_id}/{stem_type}")
-async def download_stem(session_id: str, stem_type: str, format: str = "wav"):
+# Downloads are valid for as long as the session lives (see cleanup_loop)
+DOWNLOAD_MAX_AGE = 3600
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+# _parse_range result for a well-formed range that starts past the end of the file
+RANGE_NOT_SATISFIABLE = (-1, -1)
+
+
+def _is_byte_pos(value: str) -> bool:
+    return value.isascii() and value.isdigit()
+
+
+def _parse_range(range_header: str, file_size: int):
+    """Parse a single "bytes=start-end" range. Returns (start, end) inclusive,
+    RANGE_NOT_SATISFIABLE, or None when the header should be ignored (unknown
+    unit, several ranges, malformed spec) and the full file served instead.
+    """
+    if not range_header.startswith("bytes="):
+        return None
+    spec = range_header[6:].strip()
+    start_str, sep, end_str = spec.partition("-")
+    if not sep or "," in spec:
+        return None
+    if (start_str and not _is_byte_pos(start_str)) or (end_str and not _is_byte_pos(end_str)):
+        return None
+
+    if start_str:
+        start = int(start_str)
+        end = int(end_str) if end_str else file_size - 1
+        if end_str and end < start:
+            return None
+        if start >= file_size:
+            return RANGE_NOT_SATISFIABLE
+        return start, min(end, file_size - 1)
+
+    # Suffix range: last N bytes
+    if not end_str:
+        return None
+    suffix = int(end_str)
+    if suffix == 0 or file_size == 0:
+        return RANGE_NOT_SATISFIABLE
+    return max(0, file_size - suffix), file_size - 1
+
+
+def _if_range_matches(if_range: str, etag: str, mtime: float) -> bool:
+    """If-Range holds either a strong ETag or the Last-Modified date FileResponse sends."""
+    if_range = if_range.strip()
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return if_range == formatdate(mtime, usegmt=True)
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match list ("*", W/ tags) against our ETag."""
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        tag.strip().removeprefix("W/") == etag
+        for tag in if_none_match.split(",")
+    )
+
+
+def _content_disposition(filename: str) -> str:
+    """Attachment header for filename, RFC 5987-encoded when it is not plain ASCII (as FileResponse does)."""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def _serve_file(request: Request, file_path: Path, media_type: str, filename: str) -> Response:
+    """Serve a stored audio file with caching headers and single-range support.
+
+    The file is stat'ed once and the result reused by FileResponse. Repeat
+    downloads carrying a matching If-None-Match short-circuit to 304, and
+    HEAD requests get the headers without a body.
+    """
+    try:
+        st = file_path.stat()
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File no longer available")
+
+    etag = f'"{st.st_ino:x}-{int(st.st_mtime):x}-{st.st_size:x}"'
+    headers = {
+        "Cache-Control": f"public, max-age={DOWNLOAD_MAX_AGE}",
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range and not _if_range_matches(if_range, etag, st.st_mtime):
+        range_header = None  # the client's partial copy is stale: send it all
+    byte_range = _parse_range(range_header, st.st_size) if range_header else None
+    if byte_range is not None:
+        if byte_range == RANGE_NOT_SATISFIABLE:
+            return Response(
+                status_code=416,
+                headers={**headers, "Content-Range": f"bytes */{st.st_size}"},
+            )
+        start, end = byte_range
+        range_headers = {
+            **headers,
+            "Content-Range": f"bytes {start}-{end}/{st.st_size}",
+            "Content-Length": str(end - start + 1),
+            "Content-Disposition": _content_disposition(filename),
+        }
+        if request.method == "HEAD":
+            return Response(status_code=206, media_type=media_type, headers=range_headers)
+
+        def iter_range():
+            with open(file_path, "rb") as f:
+                f.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = f.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+
+        return StreamingResponse(
+            iter_range(),
+            status_code=206,
+            media_type=media_type,
+            headers=range_headers,
+        )
+
+    return FileResponse(
+        file_path,
+        stat_result=st,
+        media_type=media_type,
+        filename=filename,
+        headers=headers,
+    )
+
+
+@app.api_route("/api/separate-stems/download/{session_id}/{stem_type}", methods=["GET", "HEAD"])
+async def download_stem(request: Request, session_id: str, stem_type: str, format: str = "wav"):
     """Download a specific stem from 6-stem separation.
 
     Args:
@@ -848,9 +1229,6 @@ async def download_stem(session_id: str, stem_type: str, format: str = "wav"):
     
     file_path = Path(stored[stem_type])
 
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="File no longer available")
-
     ext = file_path.suffix.lower()
     if ext == ".mp3":
         media_type = "audio/mpeg"
@@ -859,11 +1237,11 @@ async def download_stem(session_id: str, stem_type: str, format: str = "wav"):
         media_type = "audio/wav"
         filename = f"{stem_type}.wav"
 
-    return FileResponse(file_path, media_type=media_type, filename=filename)
+    return _serve_file(request, file_path, media_type, filename)
 
 
-@app.get("/api/analyze/download/{file_id}/{filename}")
-async def download_instrumental(file_id: str, filename: str):
+@app.api_route("/api/analyze/download/{file_id}/{filename}", methods=["GET", "HEAD"])
+async def download_instrumental(request: Request, file_id: str, filename: str):
     """Download instrumental track from chord analysis.
     
     Args:
@@ -876,14 +1254,11 @@ async def download_instrumental(file_id: str, filename: str):
     info = separated_files[file_id]
     file_path = Path(info["paths"][0])
     
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="File no longer available")
-    
-    return FileResponse(file_path, media_type="audio/wav", filename=filename)
+    return _serve_file(request, file_path, "audio/wav", filename)
 
 
-@app.get("/api/separate/download/{session_id}/{track_type}")
-async def download_separated(session_id: str, track_type: str, format: str = "wav"):
+@app.api_route("/api/separate/download/{session_id}/{track_type}", methods=["GET", "HEAD"])
+async def download_separated(request: Request, session_id: str, track_type: str, format: str = "wav"):
     """Download separated audio track.
 
     Args:
@@ -910,7 +1285,7 @@ async def download_separated(session_id: str, track_type: str, format: str = "wa
         media_type = "audio/wav"
         filename = f"{track_type}.wav"
 
-    return FileResponse(file_path, media_type=media_type, filename=filename)
+    return _serve_file(request, file_path, media_type, filename)
 
 
 @app.get("/health")
@@ -922,11 +1297,15 @@ async def health():
 async def websocket_chords(websocket: WebSocket, client_id: str):
     """WebSocket endpoint for real-time chord detection.
     
-    Send audio chunks as base64 PCM and receive chord detections.
+    Send audio chunks as binary PCM frames (or base64 JSON) and receive chord detections.
     """
     await websocket_chord_endpoint(websocket, client_id)
 
 if __name__ == "__main__":
     # Hugging Face Spaces uses port 7860 by default
     port = int(os.environ.get("PORT", 7860))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # uvloop (shipped with uvicorn[standard], not available on Windows) makes the
+    # chord WebSocket's receive/detect/send cycle noticeably cheaper per await
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    print(f"[Startup] Event loop: {loop}")
+    uvicorn.run(app, host="0.0.0.0", port=port, loop=loop)
@@ -1,8 +1,9 @@
-import urllib.request
-import urllib.parse
+import asyncio
 import json
 import ssl
 
+import httpx
+
 def test_cobalt():
     url = "https://www.youtube.com/watch?v=dQw4w9WgXcQ" 
     api_instances = [
@@ -35,38 +36,51 @@ def test_cobalt():
     ctx.verify_mode = ssl.CERT_NONE
 
     print("Testing Cobalt API Payloads...")
-    
-    for api_base in api_instances:
-        print(f"\n--- Testing Instance: {api_base} ---")
-        
-        # Endpoints to try
-        endpoints = ["/", "/api/json"]
-        
-        for ep in endpoints:
-            full_url = f"{api_base}{ep}"
-            for i, payload in enumerate(payloads):
-                try:
-                    data = json.dumps(payload).encode('utf-8')
-                    req = urllib.request.Request(full_url, data=data, headers=headers, method='POST')
-                    
-                    with urllib.request.urlopen(req, context=ctx, timeout=5) as response:
-                        if response.status == 200:
-                            body = response.read().decode('utf-8')
-                            try:
-                                json_body = json.loads(body)
-                                if 'url' in json_body or 'stream' in json_body:
-                                    print(f"  ✅ SUCCESS! Endpoint: {ep}")
-                                    print(f"  ✅ Payload: {json.dumps(payload)}")
-                                    print(f"  ✅ Response: {body[:100]}...")
-                                    return
-                                else:
-                                    pass # print(f"  ⚠️ 200 OK but weird body: {body[:50]}")
-                            except Exception:
-                                pass # print(f"  ⚠️ 200 OK but not JSON")
-                        else:
-                            pass # print(f"  Status {response.status}")
-                except Exception:
-                    pass # print(f"  Error {full_url}: {e}")
+
+    # Endpoints to try
+    endpoints = ["/", "/api/json"]
+    combos = [
+        (api_base, ep, payload)
+        for api_base in api_instances
+        for ep in endpoints
+        for payload in payloads
+    ]
+
+    async def probe(client, api_base, ep, payload):
+        try:
+            response = await client.post(f"{api_base}{ep}", json=payload, headers=headers)
+            if response.status_code == 200:
+                json_body = response.json()
+                if 'url' in json_body or 'stream' in json_body:
+                    return api_base, ep, payload, response.text
+        except Exception:
+            pass # print(f"  Error {api_base}{ep}: {e}")
+        return None
+
+    async def probe_all():
+        # Fire every (instance, endpoint, payload) combination at once and stop
+        # at the first one that works, instead of up to 30 serial 5s timeouts
+        async with httpx.AsyncClient(verify=ctx, timeout=5) as client:
+            pending = {asyncio.create_task(probe(client, *combo)) for combo in combos}
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.result() is not None:
+                            return task.result()
+            finally:
+                for task in pending:
+                    task.cancel()
+        return None
+
+    found = asyncio.run(probe_all())
+    if found:
+        api_base, ep, payload, body = found
+        print(f"\n--- Instance: {api_base} ---")
+        print(f"  ✅ SUCCESS! Endpoint: {ep}")
+        print(f"  ✅ Payload: {json.dumps(payload)}")
+        print(f"  ✅ Response: {body[:100]}...")
+        return
 
     print("\nNo working configuration found (User network might be restricted or APIs down).")
 
@@ -1,5 +1,9 @@
+import pytest
 from fastapi.testclient import TestClient
-from main import app
+from starlette.requests import Request
+
+import main
+from main import app, separated_files, _parse_range, _peer_ip, RANGE_NOT_SATISFIABLE
 
 client = TestClient(app)
 
@@ -7,3 +11,147 @@ def test_health():
     response = client.get("/health")
     assert response.status_code == 200
     assert response.json() == {"status": "ok"}
+
+
+def _stored_file(tmp_path, file_id="test-file"):
+    path = tmp_path / "instrumental.wav"
+    path.write_bytes(bytes(range(256)) * 4)
+    separated_files[file_id] = {"paths": [str(path)], "timestamp": 0, "type": "analysis"}
+    return f"/api/analyze/download/{file_id}/instrumental.wav"
+
+def test_parse_range():
+    assert _parse_range("bytes=0-99", 1024) == (0, 99)
+    assert _parse_range("bytes=1000-", 1024) == (1000, 1023)
+    assert _parse_range("bytes=-24", 1024) == (1000, 1023)
+    assert _parse_range("bytes=0-5000", 1024) == (0, 1023)
+    assert _parse_range("bytes=2000-3000", 1024) == RANGE_NOT_SATISFIABLE
+    assert _parse_range("bytes=1024-", 1024) == RANGE_NOT_SATISFIABLE
+    assert _parse_range("bytes=-0", 1024) == RANGE_NOT_SATISFIABLE
+    # Ignored (served as a full 200): several ranges, unknown unit, malformed spec
+    assert _parse_range("bytes=0-1,5-9", 1024) is None
+    assert _parse_range("items=0-1", 1024) is None
+    assert _parse_range("bytes=a-b", 1024) is None
+    assert _parse_range("bytes=9-5", 1024) is None
+    assert _parse_range("bytes=-", 1024) is None
+
+def test_download_range(tmp_path):
+    url = _stored_file(tmp_path)
+    response = client.get(url, headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 10-19/1024"
+    assert response.content == bytes(range(10, 20))
+
+def test_download_range_not_satisfiable(tmp_path):
+    url = _stored_file(tmp_path)
+    response = client.get(url, headers={"Range": "bytes=4096-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */1024"
+
+def test_download_ignored_range(tmp_path):
+    url = _stored_file(tmp_path)
+    for header in ("items=0-1", "bytes=0-1,5-9", "bytes=a-b"):
+        response = client.get(url, headers={"Range": header})
+        assert response.status_code == 200
+        assert len(response.content) == 1024
+
+def test_download_if_range(tmp_path):
+    url = _stored_file(tmp_path)
+    etag = client.get(url).headers["etag"]
+    response = client.get(url, headers={"Range": "bytes=0-1", "If-Range": etag})
+    assert response.status_code == 206
+    response = client.get(url, headers={"Range": "bytes=0-1", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert len(response.content) == 1024
+
+def test_download_not_modified(tmp_path):
+    url = _stored_file(tmp_path)
+    etag = client.get(url).headers["etag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(url, headers={"If-None-Match": f'"other", W/{etag}'}).status_code == 304
+    assert client.get(url, headers={"If-None-Match": "*"}).status_code == 304
+    assert client.get(url, headers={"If-None-Match": '"other"'}).status_code == 200
+
+def test_download_head(tmp_path):
+    url = _stored_file(tmp_path)
+    response = client.head(url)
+    assert response.status_code == 200
+    assert response.headers["content-length"] == "1024"
+    assert response.content == b""
+    response = client.head(url, headers={"Range": "bytes=0-1"})
+    assert response.status_code == 206
+    assert response.headers["content-length"] == "2"
+    assert response.content == b""
+
+def test_download_range_non_ascii_filename(tmp_path):
+    url = _stored_file(tmp_path).replace("instrumental.wav", "%E4%B8%AD.wav")
+    response = client.get(url, headers={"Range": "bytes=0-1"})
+    assert response.status_code == 206
+    assert response.headers["content-disposition"] == "attachment; filename*=utf-8''%E4%B8%AD.wav"
+
+
+def _request(forwarded=None):
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "headers": headers, "client": ("10.0.0.9", 1234)})
+
+def test_peer_ip_uses_proxy_appended_hop():
+    assert _peer_ip(_request("203.0.113.7")) == "203.0.113.7"
+    # A forged first hop is ignored: the edge proxy appends the real address last
+    assert _peer_ip(_request("1.2.3.4, 203.0.113.7")) == "203.0.113.7"
+    assert _peer_ip(_request()) == "10.0.0.9"
+
+
+def test_upload_rejects_non_audio():
+    response = client.post("/api/analyze", files={"file": ("notes.txt", b"hello", "text/plain")})
+    assert response.status_code == 415
+
+def test_upload_rejects_oversized(monkeypatch):
+    monkeypatch.setattr(main, "MAX_UPLOAD_BYTES", 16)
+    response = client.post("/api/analyze", files={"file": ("song.wav", b"x" * 64, "audio/wav")})
+    assert response.status_code == 413
+
+
+@pytest.fixture
+def analysis_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "ANALYSIS_CACHE_DIR", tmp_path)
+    monkeypatch.setattr(main, "STEMS_CACHE_DIR", tmp_path / "stems")
+    main._analysis_memory_cache.clear()
+    calls = []
+
+    def fake_analyze(path, separate_vocals=False):
+        calls.append(path)
+        return {"tempo": 120, "chords": []}
+
+    monkeypatch.setattr(main, "analyze_file", fake_analyze)
+    return calls
+
+def test_upload_analysis_cached_by_content(analysis_cache):
+    for name in ("a.wav", "b.wav"):
+        response = client.post(
+            "/api/analyze",
+            files={"file": (name, b"same audio bytes", "audio/wav")},
+            data={"use_madmom": "false"},
+        )
+        assert response.status_code == 200
+        assert response.json()["tempo"] == 120
+    assert len(analysis_cache) == 1
+    # The on-disk entry survives the in-memory LRU being dropped
+    main._analysis_memory_cache.clear()
+    client.post("/api/analyze", files={"file": ("c.wav", b"same audio bytes", "audio/wav")}, data={"use_madmom": "false"})
+    assert len(analysis_cache) == 1
+
+def test_youtube_analysis_cached_by_video_id(analysis_cache, tmp_path):
+    audio_path = tmp_path / "dQw4w9WgXcQ.mp3"
+    audio_path.write_bytes(b"x")
+    audio_info = {"audio_path": str(audio_path), "video_id": "dQw4w9WgXcQ", "title": "t", "duration": 1, "thumbnail": ""}
+    for _ in range(2):
+        response = main._analyze_youtube_audio(audio_info, "dQw4w9WgXcQ", False, False, "10.0.0.1")
+        assert response.status_code == 200
+    assert len(analysis_cache) == 1
+
+
+def test_dns_serves_stale_pin_until_refreshed(monkeypatch):
+    def no_lookup(host):
+        raise AssertionError("request path must not resolve")
+    monkeypatch.setattr(main, "_query_youtube_host", no_lookup)
+    monkeypatch.setitem(main._dns_cache, "www.youtube.com", ("142.250.0.1", main.time.time() - 10))
+    assert main._resolve_youtube_host("www.youtube.com") == "142.250.0.1"
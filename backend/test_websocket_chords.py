@@ -0,0 +1,83 @@
+import struct
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from websocket_chords import (
+    HOP_LENGTH,
+    N_FFT,
+    AudioRingBuffer,
+    _chroma_filterbank,
+    _power_spectrogram,
+    websocket_chord_endpoint,
+)
+
+
+def test_ring_buffer_partial_fill():
+    buf = AudioRingBuffer(8)
+    buf.write(np.arange(3, dtype=np.float32))
+    assert len(buf) == 3
+    assert buf.get().tolist() == [0, 1, 2]
+
+def test_ring_buffer_wraps_around():
+    buf = AudioRingBuffer(8)
+    buf.write(np.arange(6, dtype=np.float32))
+    buf.write(np.arange(6, 11, dtype=np.float32))
+    assert len(buf) == 8
+    assert buf.get().tolist() == list(range(3, 11))
+    buf.write(np.arange(11, 14, dtype=np.float32))
+    assert buf.get().tolist() == list(range(6, 14))
+
+def test_ring_buffer_oversized_write():
+    buf = AudioRingBuffer(8)
+    buf.write(np.arange(2, dtype=np.float32))
+    buf.write(np.arange(20, dtype=np.float32))
+    assert buf.get().tolist() == list(range(12, 20))
+
+def test_ring_buffer_clear():
+    buf = AudioRingBuffer(8)
+    buf.write(np.arange(10, dtype=np.float32))
+    buf.clear()
+    assert len(buf) == 0
+    buf.write(np.arange(2, dtype=np.float32))
+    assert buf.get().tolist() == [0, 1]
+
+
+def _ws_client():
+    app = FastAPI()
+    app.add_api_websocket_route("/ws/chords/{client_id}", websocket_chord_endpoint)
+    return TestClient(app)
+
+def _audio_frame(timestamp, samples):
+    pcm = np.round(np.clip(samples, -1, 1) * 32767).astype("<i2")
+    return struct.pack("<d", timestamp) + pcm.tobytes()
+
+def test_binary_frame_decodes_timestamp_and_pcm():
+    sr = 22050
+    t = np.arange(int(sr * 0.6)) / sr
+    triad = sum(np.sin(2 * np.pi * f * t) for f in (261.63, 329.63, 392.0)) / 3
+    with _ws_client().websocket_connect("/ws/chords/test") as ws:
+        ws.send_bytes(b"\x00" * 4)  # shorter than the header: ignored
+        ws.send_bytes(_audio_frame(1.5, triad))
+        message = ws.receive_json()
+    assert message["type"] == "chord"
+    assert message["timestamp"] == 1.5
+    assert message["chord"] == "C"
+
+
+def test_chroma_filterbank_matches_librosa():
+    librosa = pytest.importorskip("librosa")
+    for sr in (22050, 44100):
+        expected = librosa.filters.chroma(sr=sr, n_fft=N_FFT)
+        np.testing.assert_allclose(_chroma_filterbank(sr), expected, rtol=1e-4, atol=1e-6)
+
+def test_power_spectrogram_matches_librosa():
+    librosa = pytest.importorskip("librosa")
+    rng = np.random.default_rng(0)
+    audio = rng.uniform(-1, 1, 22050).astype(np.float32)
+    expected = np.abs(librosa.stft(audio, n_fft=N_FFT, hop_length=HOP_LENGTH, center=True, pad_mode="constant")) ** 2
+    actual = _power_spectrogram(audio)
+    assert actual.shape == expected.shape
+    np.testing.assert_allclose(actual, expected, rtol=1e-3, atol=1e-3 * expected.max())
@@ -0,0 +1,189 @@
+import asyncio
+import os
+
+import pytest
+
+import youtube
+from youtube import check_rate_limit, extract_video_id, get_remaining_requests, sweep_rate_limits
+
+WINDOW_START = 1_000 * youtube.RATE_LIMIT_WINDOW
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [float(WINDOW_START)]
+    monkeypatch.setattr(youtube.time, "time", lambda: now[0])
+    monkeypatch.setattr(youtube, "RATE_LIMIT_REQUESTS", 3)
+    for shard in youtube._request_counts:
+        shard.clear()
+    return now
+
+def test_rate_limit_allows_up_to_limit(clock):
+    assert [check_rate_limit("10.0.0.1") for _ in range(3)] == [True, True, True]
+    assert get_remaining_requests("10.0.0.1") == 0
+
+def test_rate_limit_denies_above_limit(clock):
+    for _ in range(3):
+        check_rate_limit("10.0.0.2")
+    assert not check_rate_limit("10.0.0.2")
+    assert check_rate_limit("10.0.0.3")
+
+def test_rate_limit_window_rollover(clock):
+    for _ in range(3):
+        check_rate_limit("10.0.0.4")
+    # Halfway through the next window the previous 3 requests still weigh 1.5
+    clock[0] += 1.5 * youtube.RATE_LIMIT_WINDOW
+    assert get_remaining_requests("10.0.0.4") == 1
+    assert check_rate_limit("10.0.0.4")
+    assert check_rate_limit("10.0.0.4")
+    assert not check_rate_limit("10.0.0.4")
+    # Two windows later nothing carries over
+    clock[0] += 2 * youtube.RATE_LIMIT_WINDOW
+    assert get_remaining_requests("10.0.0.4") == 3
+
+def test_sweep_rate_limits(clock):
+    check_rate_limit("10.0.0.5")
+    clock[0] += youtube.RATE_LIMIT_WINDOW
+    check_rate_limit("10.0.0.6")
+    assert sweep_rate_limits() == 0  # 10.0.0.5 still counts in the sliding window
+    clock[0] += youtube.RATE_LIMIT_WINDOW
+    assert sweep_rate_limits() == 1
+    assert get_remaining_requests("10.0.0.5") == 3
+    clock[0] += youtube.RATE_LIMIT_WINDOW
+    assert sweep_rate_limits() == 1
+    assert not any(youtube._request_counts)
+
+
+@pytest.mark.parametrize("url", ["dQw4w9WgXcQ", "a-b_c1234XY"])
+def test_extract_video_id_bare(url):
+    assert extract_video_id(url) == url
+
+@pytest.mark.parametrize("url", ["", "dQw4w9WgXc", "dQw4w9WgX!Q", "dQw4w9WgXcQQ"])
+def test_extract_video_id_bare_invalid(url):
+    assert extract_video_id(url) is None
+
+
+@pytest.mark.parametrize("url", [
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "https://youtube.com/watch?v=dQw4w9WgXcQ&t=42s",
+    "https://music.youtube.com/watch?v=dQw4w9WgXcQ&list=RD",
+    "https://youtu.be/dQw4w9WgXcQ?si=abc",
+    "https://www.youtube.com/embed/dQw4w9WgXcQ",
+])
+def test_extract_video_id_url(url):
+    assert extract_video_id(url) == "dQw4w9WgXcQ"
+
+@pytest.mark.parametrize("url", [
+    "https://example.com/watch?v=dQw4w9WgXcQ",
+    "https://www.youtube.com/watch?v=short",
+])
+def test_extract_video_id_url_invalid(url):
+    assert extract_video_id(url) is None
+
+
+def _age(path, hours):
+    then = youtube.time.time() - hours * 3600
+    os.utime(path, (then, then))
+
+def test_cleanup_old_files(tmp_path):
+    for name in ["old.mp3", "old.json", "new.mp3", "new.json", "abc_fallback0.m4a", "abc.mp4", "notes.txt"]:
+        (tmp_path / name).write_bytes(b"x")
+    for name in ["old.mp3", "old.json", "abc_fallback0.m4a", "abc.mp4", "notes.txt"]:
+        _age(tmp_path / name, 25)
+    _age(tmp_path / "new.mp3", 25)
+    youtube._touch(tmp_path / "new.mp3")  # a cache hit renews the download
+    youtube.cleanup_old_files(tmp_path)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["new.json", "new.mp3", "notes.txt"]
+    assert not youtube._download_locks
+
+
+@pytest.mark.parametrize("head, expected", [
+    (b"ID3\x04\x00", True),
+    (b"\xff\xfb\x90\x00", True),   # MPEG-1 Layer III
+    (b"\xff\xf3\x90\x00", True),   # MPEG-2 Layer III
+    (b"\xff\xf1\x50\x80", False),  # AAC ADTS
+    (b"\x00\x00\x00\x20ftypM4A ", False),
+    (b"", False),
+])
+def test_is_mp3(tmp_path, head, expected):
+    path = tmp_path / "audio.bin"
+    path.write_bytes(head)
+    assert youtube._is_mp3(path) is expected
+
+def test_is_mp3_missing_file(tmp_path):
+    assert not youtube._is_mp3(tmp_path / "missing.mp3")
+
+
+class _Attempt:
+    """Stand-in for a finished asyncio task, as seen by _record_attempt."""
+
+    def __init__(self, error=None, cancelled=False):
+        self._error = error
+        self._cancelled = cancelled
+
+    def cancelled(self):
+        return self._cancelled
+
+    def exception(self):
+        return self._error
+
+@pytest.fixture
+def instance_health(monkeypatch):
+    monkeypatch.setattr(youtube, "_instance_health", {})
+    return youtube._instance_health
+
+def test_breaker_orders_and_skips_instances(instance_health):
+    attempts = [("Invidious", base, None, "m4a") for base in ("a", "b", "c", "d")]
+    youtube._record_attempt("b", _Attempt(error=RuntimeError("down")))
+    youtube._record_attempt("c", _Attempt())
+    youtube._record_attempt("d", _Attempt(cancelled=True))  # lost a race: no penalty
+    assert [a[1] for a in youtube._order_attempts(attempts)] == ["c", "a", "d"]
+
+def test_breaker_cooldown_doubles_and_caps(instance_health):
+    for _ in range(10):
+        youtube._record_attempt("a", _Attempt(error=RuntimeError("down")))
+    health = instance_health["a"]
+    assert health["failures"] == 10
+    assert health["cooldown_until"] - youtube.time.time() <= youtube.INSTANCE_COOLDOWN_MAX
+
+def test_breaker_tries_everything_when_all_cooling(instance_health):
+    attempts = [("Piped", base, None, "m4a") for base in ("a", "b")]
+    for base in ("a", "b"):
+        youtube._record_attempt(base, _Attempt(error=RuntimeError("down")))
+    assert youtube._order_attempts(attempts) == attempts
+
+
+@pytest.fixture
+def fallbacks(monkeypatch, instance_health):
+    monkeypatch.setattr(youtube, "INVIDIOUS_INSTANCES", ["https://slow", "https://broken", "https://fast"])
+    monkeypatch.setattr(youtube, "PIPED_INSTANCES", [])
+    monkeypatch.setattr(youtube, "COBALT_INSTANCES", [])
+
+    async def fetch(client, base, video_id, dest):
+        dest.write_bytes(b"partial")
+        try:
+            if base == "https://broken":
+                raise RuntimeError("returned 403")
+            await asyncio.sleep(0.05 if base == "https://fast" else 10)
+            dest.write_bytes(b"audio from " + base.encode())
+            return dest
+        except BaseException:
+            # Like _download_stream: a failed or cancelled attempt removes its file
+            dest.unlink(missing_ok=True)
+            raise
+
+    monkeypatch.setattr(youtube, "_fetch_invidious", fetch)
+
+def test_race_keeps_first_download(fallbacks, tmp_path, instance_health):
+    winner = youtube._race_fallbacks("dQw4w9WgXcQ", tmp_path)
+    assert winner.read_bytes() == b"audio from https://fast"
+    assert list(tmp_path.iterdir()) == [winner]  # the cancelled loser cleaned up
+    assert instance_health["https://broken"]["failures"] == 1
+    assert instance_health["https://fast"]["last_success"] > 0
+    assert "https://slow" not in instance_health
+
+def test_race_times_out(fallbacks, tmp_path, monkeypatch):
+    monkeypatch.setattr(youtube, "INVIDIOUS_INSTANCES", ["https://slow"])
+    monkeypatch.setattr(youtube, "FALLBACK_RACE_TIMEOUT", 0.2)
+    assert youtube._race_fallbacks("dQw4w9WgXcQ", tmp_path) is None
+    assert not list(tmp_path.iterdir())
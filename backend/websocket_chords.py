@@ -2,11 +2,77 @@
 WebSocket endpoint for real-time chord streaming
 """
 
+import asyncio
 import base64
+import struct
+import time
+from functools import lru_cache
 
 from fastapi import WebSocket, WebSocketDisconnect
 import numpy as np
-import librosa
+import orjson
+
+# Try to import numba for the scoring kernel, but don't fail if it's not available
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# Chroma analysis setup: a plain NumPy STFT and a fixed bin-to-pitch-class
+# projection, both built once instead of per message.
+N_FFT = 2048
+HOP_LENGTH = 512
+_STFT_WINDOW = (0.5 - 0.5 * np.cos(2.0 * np.pi * np.arange(N_FFT) / N_FFT)).astype(np.float32)  # periodic Hann
+CHROMA_CENTER_OCTAVE = 5.0  # octave weighting, in octaves above A0 (27.5 Hz)
+CHROMA_OCTAVE_WIDTH = 2.0
+
+
+@lru_cache(maxsize=4)
+def _chroma_filterbank(sr: int) -> np.ndarray:
+    """(12, 1 + N_FFT // 2) STFT-bin to pitch-class projection, built once per sample rate.
+
+    Same construction as librosa.filters.chroma (tuning=0, C first): each bin is
+    spread over nearby pitch classes with a Gaussian as wide as the bin itself,
+    so low notes that fall between bins are not lost, and then weighted towards
+    the middle octaves.
+    """
+    freqs = np.linspace(0, sr, N_FFT, endpoint=False)[1:]
+    # Bin positions in semitones above A0; the DC bin sits 1.5 octaves below bin 1
+    frqbins = 12.0 * np.log2(freqs / 27.5)
+    frqbins = np.concatenate(([frqbins[0] - 18.0], frqbins))
+    binwidthbins = np.concatenate((np.maximum(frqbins[1:] - frqbins[:-1], 1.0), [1.0]))
+
+    dist = frqbins[np.newaxis, :] - np.arange(12)[:, np.newaxis]
+    dist = np.remainder(dist + 6 + 120, 12) - 6  # wrap to [-6, 6) semitones
+    wts = np.exp(-0.5 * (2 * dist / binwidthbins[np.newaxis, :]) ** 2)
+    wts /= np.maximum(np.linalg.norm(wts, axis=0, keepdims=True), 1e-10)
+    wts *= np.exp(-0.5 * ((frqbins / 12.0 - CHROMA_CENTER_OCTAVE) / CHROMA_OCTAVE_WIDTH) ** 2)
+
+    # Rows start at A; rotate so C comes first, and keep the bins up to Nyquist
+    wts = np.roll(wts, -3, axis=0)
+    return np.ascontiguousarray(wts[:, : 1 + N_FFT // 2], dtype=np.float32)
+
+
+def _power_spectrogram(audio_data: np.ndarray) -> np.ndarray:
+    """Centered, Hann-windowed STFT power spectrogram, shape (1 + N_FFT // 2, n_frames)."""
+    padded = np.pad(np.asarray(audio_data, dtype=np.float32), N_FFT // 2)
+    frames = np.lib.stride_tricks.sliding_window_view(padded, N_FFT)[::HOP_LENGTH]
+    spec = np.fft.rfft(frames * _STFT_WINDOW, axis=1)
+    return (spec.real ** 2 + spec.imag ** 2).T
+
+
+# Streams always arrive at 22050 Hz; build that filterbank at import
+_chroma_filterbank(22050)
+
+# Run detection at most this often per client, however fast chunks arrive
+DETECT_INTERVAL = 0.2
+
+# Binary audio frames start with the chunk timestamp (float64, little-endian)
+AUDIO_FRAME_HEADER = struct.Struct("<d")
+
+# 16-bit PCM to [-1, 1) float
+PCM16_SCALE = np.float32(1.0 / 32768.0)
 
 # Chord detection setup
 PITCH_CLASS_NAMES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
@@ -34,6 +100,42 @@ for root in range(12):
             chord_name += f"{name}"
         CHORD_TEMPLATES.append((chord_name, v / (norm + 1e-9)))
 
+# Templates stacked into a (108, 12) matrix so scoring is a single matrix-vector product
+CHORD_MATRIX = np.stack([tpl[1] for tpl in CHORD_TEMPLATES]).astype(np.float32)
+CHORD_NAMES = [tpl[0] for tpl in CHORD_TEMPLATES]
+
+# int8 copy of the templates for scoring; scores are scaled back once per call
+CHORD_MATRIX_SCALE = 127.0 / float(np.abs(CHORD_MATRIX).max())
+CHORD_MATRIX_I8 = np.round(CHORD_MATRIX * CHORD_MATRIX_SCALE).astype(np.int8)
+# numba accumulates the int8 products in int32 itself; numpy needs int32 operands
+_SCORE_MATRIX = CHORD_MATRIX_I8 if NUMBA_AVAILABLE else CHORD_MATRIX_I8.astype(np.int32)
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def _score_chords(vec, matrix):
+        """Return (best template index, its raw integer score) for a quantized chroma vector."""
+        best_idx = 0
+        best_score = -1  # templates and chroma are non-negative
+        for i in range(matrix.shape[0]):
+            score = np.int32(0)
+            for j in range(matrix.shape[1]):
+                score += np.int32(matrix[i, j]) * np.int32(vec[j])
+            if score > best_score:
+                best_score = score
+                best_idx = i
+        return best_idx, best_score
+else:
+    def _score_chords(vec, matrix):
+        """Return (best template index, its raw integer score) for a quantized chroma vector."""
+        scores = matrix @ vec.astype(np.int32)
+        best_idx = int(np.argmax(scores))
+        return best_idx, int(scores[best_idx])
+
+# Compile (or load from numba's cache) at import, like the filterbank above:
+# the first realtime detection runs on the event loop and must not pay for it
+_score_chords(np.zeros(CHORD_MATRIX_I8.shape[1], dtype=np.int8), _SCORE_MATRIX)
+
 
 def detect_chord_from_audio(audio_data: np.ndarray, sr: int = 22050) -> dict:
     """
@@ -50,23 +152,26 @@ def detect_chord_from_audio(audio_data: np.ndarray, sr: int = 22050) -> dict:
         return {"chord": "N.C.", "confidence": 0.0}
     
     try:
-        # Compute chroma features
-        chroma = librosa.feature.chroma_cqt(y=audio_data, sr=sr, hop_length=512)
+        # Compute chroma features from an STFT power spectrogram. Much cheaper than a
+        # CQT for a ~1s buffer, and the projection is cached rather than rebuilt.
+        chroma = _chroma_filterbank(sr) @ _power_spectrogram(audio_data)
+        # Scale each frame so its strongest pitch class is 1 (silent frames stay 0)
+        chroma /= np.maximum(chroma.max(axis=0, keepdims=True), 1e-10)
         
-        # Average across time
-        vec = chroma.mean(axis=1)
-        norm = np.linalg.norm(vec)
+        # Average across time, then normalize and find best matching chord
+        vec = chroma.mean(axis=1).astype(np.float32)
+        norm = float(np.linalg.norm(vec))
         
         if norm < 0.05:
             return {"chord": "N.C.", "confidence": 0.0}
         
-        vec = vec / (norm + 1e-9)
+        # Quantize to int8 (chroma is non-negative) and score against the int8 templates
+        vec_scale = 127.0 / (float(vec.max()) + 1e-9)
+        vec_i8 = np.round(vec * vec_scale).astype(np.int8)
+        best_idx, raw_score = _score_chords(vec_i8, _SCORE_MATRIX)
         
-        # Find best matching chord
-        scores = [float(np.dot(vec, tpl[1])) for tpl in CHORD_TEMPLATES]
-        best_idx = int(np.argmax(scores))
-        chord_name, _ = CHORD_TEMPLATES[best_idx]
-        confidence = min(1.0, scores[best_idx])
+        chord_name = CHORD_NAMES[int(best_idx)]
+        confidence = min(1.0, float(raw_score) / (CHORD_MATRIX_SCALE * vec_scale * norm))
         
         return {"chord": chord_name, "confidence": float(confidence)}
         
@@ -75,6 +180,47 @@ def detect_chord_from_audio(audio_data: np.ndarray, sr: int = 22050) -> dict:
         return {"chord": "N.C.", "confidence": 0.0}
 
 
+class AudioRingBuffer:
+    """Fixed-size float32 ring buffer holding the most recent samples of a stream."""
+
+    def __init__(self, size: int):
+        self.buffer = np.zeros(size, dtype=np.float32)
+        self.size = size
+        self.pos = 0
+        self.filled = 0
+
+    def __len__(self) -> int:
+        return self.filled
+
+    def write(self, samples: np.ndarray):
+        k = len(samples)
+        if k >= self.size:
+            self.buffer[:] = samples[-self.size:]
+            self.pos = 0
+            self.filled = self.size
+            return
+
+        end = self.pos + k
+        if end <= self.size:
+            self.buffer[self.pos:end] = samples
+        else:
+            first = self.size - self.pos
+            self.buffer[self.pos:] = samples[:first]
+            self.buffer[:k - first] = samples[first:]
+        self.pos = end % self.size
+        self.filled = min(self.size, self.filled + k)
+
+    def get(self) -> np.ndarray:
+        """Return the buffered samples in chronological order."""
+        if self.filled < self.size:
+            return self.buffer[:self.filled]
+        return np.concatenate([self.buffer[self.pos:], self.buffer[:self.pos]])
+
+    def clear(self):
+        self.pos = 0
+        self.filled = 0
+
+
 class ChordStreamManager:
     """Manages WebSocket connections for real-time chord streaming."""
     
@@ -94,11 +240,28 @@ class ChordStreamManager:
     async def send_chord(self, client_id: str, data: dict):
         if client_id in self.active_connections:
             try:
-                await self.active_connections[client_id].send_json(data)
+                await self.active_connections[client_id].send_text(orjson.dumps(data).decode())
             except Exception as e:
                 print(f"[WS] Error sending to {client_id}: {e}")
                 self.disconnect(client_id)
 
+    async def run_writer(self, client_id: str, queue: asyncio.Queue):
+        """Single writer per client. Sends queued messages in order, but when
+        several chord updates have piled up only the latest one is sent."""
+        while True:
+            pending = [await queue.get()]
+            while True:
+                try:
+                    pending.append(queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+
+            last_chord = max((i for i, msg in enumerate(pending) if msg.get("type") == "chord"), default=-1)
+            for i, msg in enumerate(pending):
+                if msg.get("type") == "chord" and i != last_chord:
+                    continue
+                await self.send_chord(client_id, msg)
+
 
 # Global manager instance
 chord_stream_manager = ChordStreamManager()
@@ -108,8 +271,11 @@ async def websocket_chord_endpoint(websocket: WebSocket, client_id: str):
     """
     WebSocket endpoint for real-time chord detection.
     
-    Client sends audio chunks as base64-encoded PCM data.
-    Server responds with detected chords.
+    Client sends audio chunks as binary frames, or as base64-encoded PCM data
+    inside a JSON message. Server responds with detected chords.
+    
+    Binary frame from client:
+        <float64 LE timestamp seconds><PCM 16-bit mono 22050Hz samples>
     
     Message format from client:
     {
@@ -135,37 +301,55 @@ async def websocket_chord_endpoint(websocket: WebSocket, client_id: str):
     """
     await chord_stream_manager.connect(websocket, client_id)
     
-    audio_buffer = np.array([], dtype=np.float32)
+    # Keep last 1 second of audio for analysis
+    audio_buffer = AudioRingBuffer(22050)
+    last_detect_ts = 0.0
+
+    send_queue: asyncio.Queue = asyncio.Queue()
+    writer = asyncio.create_task(chord_stream_manager.run_writer(client_id, send_queue))
     
     try:
         while True:
-            data = await websocket.receive_json()
-            msg_type = data.get("type")
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+
+            if message.get("bytes") is not None:
+                # Binary audio frame: timestamp header followed by raw PCM, no base64
+                frame = message["bytes"]
+                if len(frame) < AUDIO_FRAME_HEADER.size:
+                    continue
+                msg_type = "audio_chunk"
+                (timestamp,) = AUDIO_FRAME_HEADER.unpack_from(frame)
+                audio_bytes = memoryview(frame)[AUDIO_FRAME_HEADER.size:]
+            else:
+                data = orjson.loads(message.get("text") or "{}")
+                msg_type = data.get("type")
+                if msg_type == "audio_chunk":
+                    timestamp = data.get("timestamp", 0.0)
+                    # Decode base64 audio
+                    audio_b64 = data.get("data", "")
+                    try:
+                        audio_bytes = base64.b64decode(audio_b64) if audio_b64 else b""
+                    except ValueError as e:
+                        print(f"[WS] Audio chunk error: {e}")
+                        audio_bytes = b""
             
             if msg_type == "audio_chunk":
-                # Decode base64 audio
-                audio_b64 = data.get("data", "")
-                timestamp = data.get("timestamp", 0.0)
-                
-                if audio_b64:
+                if audio_bytes:
                     try:
-                        # Decode base64 to bytes
-                        audio_bytes = base64.b64decode(audio_b64)
-                        # Convert to numpy (assuming 16-bit PCM mono)
-                        audio_chunk = np.frombuffer(audio_bytes, dtype=np.int16).astype(np.float32) / 32768.0
+                        # Convert to numpy (assuming 16-bit PCM mono), casting and scaling in one pass
+                        audio_chunk = np.multiply(np.frombuffer(audio_bytes, dtype=np.int16), PCM16_SCALE, dtype=np.float32)
                         
                         # Append to buffer
-                        audio_buffer = np.concatenate([audio_buffer, audio_chunk])
-                        
-                        # Keep last 1 second of audio for analysis
-                        max_samples = 22050
-                        if len(audio_buffer) > max_samples:
-                            audio_buffer = audio_buffer[-max_samples:]
+                        audio_buffer.write(audio_chunk)
                         
                         # Detect chord if we have enough audio (at least 0.5s)
-                        if len(audio_buffer) >= 11025:
-                            result = detect_chord_from_audio(audio_buffer, sr=22050)
-                            await chord_stream_manager.send_chord(client_id, {
+                        now = time.monotonic()
+                        if len(audio_buffer) >= 11025 and now - last_detect_ts >= DETECT_INTERVAL:
+                            last_detect_ts = now
+                            result = detect_chord_from_audio(audio_buffer.get(), sr=22050)
+                            send_queue.put_nowait({
                                 "type": "chord",
                                 "chord": result["chord"],
                                 "confidence": result["confidence"],
@@ -175,14 +359,16 @@ async def websocket_chord_endpoint(websocket: WebSocket, client_id: str):
                         print(f"[WS] Audio chunk error: {e}")
             
             elif msg_type == "ping":
-                await chord_stream_manager.send_chord(client_id, {"type": "pong"})
+                send_queue.put_nowait({"type": "pong"})
             
             elif msg_type == "clear":
-                audio_buffer = np.array([], dtype=np.float32)
-                await chord_stream_manager.send_chord(client_id, {"type": "cleared"})
+                audio_buffer.clear()
+                send_queue.put_nowait({"type": "cleared"})
                 
     except WebSocketDisconnect:
         chord_stream_manager.disconnect(client_id)
     except Exception as e:
         print(f"[WS] Error in chord stream: {e}")
         chord_stream_manager.disconnect(client_id)
+    finally:
+        writer.cancel()
@@ -4,55 +4,124 @@ YouTube audio extraction utilities using yt-dlp.
 Handles downloading audio from YouTube URLs for chord analysis.
 """
 
+import asyncio
+import atexit
+import hashlib
+import json
+import math
 import os
 import re
+import shutil
 import tempfile
 import time
 from pathlib import Path
-from typing import Optional, Dict, Any
-from collections import defaultdict
+from typing import Optional, Dict, Any, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from functools import partial
 import threading
 import subprocess
 
-# Rate limiting: track requests per IP
-_rate_limit_lock = threading.Lock()
-_request_counts: Dict[str, list] = defaultdict(list)  # IP -> list of timestamps
+import httpx
+import orjson
+from starlette.concurrency import run_in_threadpool
+
+# Rate limiting: sliding-window counter per IP. Each IP keeps only the request
+# counts of the previous and current fixed window; the previous count is weighted
+# by how much of it still overlaps the sliding window. State is split into shards
+# by IP hash, each with its own lock, so checks for unrelated IPs never contend.
+_RATE_LIMIT_SHARDS = 32  # power of two
+_rate_limit_locks = [threading.Lock() for _ in range(_RATE_LIMIT_SHARDS)]
+_request_counts: list[Dict[str, Tuple[int, int, int]]] = [{} for _ in range(_RATE_LIMIT_SHARDS)]  # IP -> (prev, curr, window index)
+
+
+def _shard_for(client_ip: str) -> int:
+    return hash(client_ip) & (_RATE_LIMIT_SHARDS - 1)
 
 # Rate limit constants
 RATE_LIMIT_REQUESTS = 100  # max requests (increased for testing)creased for testing)
 RATE_LIMIT_WINDOW = 3600  # per hour (seconds)
 
 
+def _roll(counts: Tuple[int, int, int], now: float) -> Tuple[int, int, int, float]:
+    """Advance (prev, curr, window) to the window containing now and estimate the sliding count."""
+    prev, curr, window = counts
+    current = int(now // RATE_LIMIT_WINDOW)
+    if current != window:
+        prev = curr if current == window + 1 else 0
+        curr = 0
+    overlap = 1.0 - (now % RATE_LIMIT_WINDOW) / RATE_LIMIT_WINDOW
+    return prev, curr, current, curr + prev * overlap
+
+
 def check_rate_limit(client_ip: str) -> bool:
     """
     Check if a client IP has exceeded the rate limit.
     
     Returns True if request is allowed, False if rate limited.
     """
-    with _rate_limit_lock:
-        now = time.time()
-        # Clean up old timestamps
-        _request_counts[client_ip] = [
-            ts for ts in _request_counts[client_ip] 
-            if now - ts < RATE_LIMIT_WINDOW
-        ]
+    idx = _shard_for(client_ip)
+    now = time.time()
+    with _rate_limit_locks[idx]:
+        counts = _request_counts[idx].get(client_ip, (0, 0, int(now // RATE_LIMIT_WINDOW)))
+        prev, curr, window, estimate = _roll(counts, now)
         
-        if len(_request_counts[client_ip]) >= RATE_LIMIT_REQUESTS:
+        if estimate >= RATE_LIMIT_REQUESTS:
+            _request_counts[idx][client_ip] = (prev, curr, window)
             return False
         
-        _request_counts[client_ip].append(now)
+        _request_counts[idx][client_ip] = (prev, curr + 1, window)
         return True
 
 
 def get_remaining_requests(client_ip: str) -> int:
     """Get remaining requests for an IP within the current window."""
-    with _rate_limit_lock:
-        now = time.time()
-        valid_requests = [
-            ts for ts in _request_counts[client_ip] 
-            if now - ts < RATE_LIMIT_WINDOW
-        ]
-        return max(0, RATE_LIMIT_REQUESTS - len(valid_requests))
+    idx = _shard_for(client_ip)
+    now = time.time()
+    with _rate_limit_locks[idx]:
+        counts = _request_counts[idx].get(client_ip)
+        if counts is None:
+            return RATE_LIMIT_REQUESTS
+        prev, curr, window, estimate = _roll(counts, now)
+        _request_counts[idx][client_ip] = (prev, curr, window)
+        return max(0, RATE_LIMIT_REQUESTS - math.ceil(estimate))
+
+
+RATE_LIMIT_SWEEP_INTERVAL = 60  # seconds
+
+
+def sweep_rate_limits():
+    """Forget IPs with no requests in the previous or current window."""
+    current = int(time.time() // RATE_LIMIT_WINDOW)
+    removed = 0
+    for idx in range(_RATE_LIMIT_SHARDS):
+        with _rate_limit_locks[idx]:
+            counts = _request_counts[idx]
+            dead = [
+                ip for ip, (prev, curr, window) in counts.items()
+                if window < current - 1 or (window == current - 1 and curr == 0) or (prev == 0 and curr == 0)
+            ]
+            for ip in dead:
+                del counts[ip]
+            removed += len(dead)
+    return removed
+
+
+def rate_limit_sweep_loop():
+    """Background loop that keeps the rate-limit tables from growing with one-off IPs."""
+    while True:
+        time.sleep(RATE_LIMIT_SWEEP_INTERVAL)
+        try:
+            removed = sweep_rate_limits()
+            if removed:
+                print(f"[YouTube] Rate limit sweep: forgot {removed} idle IPs")
+        except Exception as e:
+            print(f"[YouTube] Rate limit sweep error: {e}")
+
+
+_VIDEO_ID_RE = re.compile(r'(?:youtube\.com/(?:watch\?v=|embed/)|youtu\.be/)([a-zA-Z0-9_-]{11})')
+_VIDEO_ID_CHARS = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_-")
 
 
 def extract_video_id(url: str) -> Optional[str]:
@@ -64,87 +133,172 @@ def extract_video_id(url: str) -> Optional[str]:
     - https://youtu.be/VIDEO_ID
     - https://www.youtube.com/embed/VIDEO_ID
     - https://music.youtube.com/watch?v=VIDEO_ID
+    - VIDEO_ID on its own
     """
-    patterns = [
-        r'(?:youtube\.com/watch\?v=|youtu\.be/|youtube\.com/embed/|music\.youtube\.com/watch\?v=)([a-zA-Z0-9_-]{11})',
-        r'^([a-zA-Z0-9_-]{11})$'  # Just the ID itself
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            return match.group(1)
-    
-    return None
+    # Just the ID itself: a plain character check, no regex needed
+    if len(url) == 11 and _VIDEO_ID_CHARS.issuperset(url):
+        return url
+
+    match = _VIDEO_ID_RE.search(url)
+    return match.group(1) if match else None
+
+
+# Cookie files live in tmpfs when available so they never touch disk, inside a
+# private (0700) per-process directory that is removed again at exit
+COOKIE_PARENT_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+_cookie_dir: Optional[Path] = None
+_cookie_dir_lock = threading.Lock()
+
+
+def _get_cookie_dir() -> Path:
+    global _cookie_dir
+    with _cookie_dir_lock:
+        if _cookie_dir is None:
+            path = Path(tempfile.mkdtemp(prefix="guitariz_cookies_", dir=COOKIE_PARENT_DIR))
+            atexit.register(shutil.rmtree, path, ignore_errors=True)
+            _cookie_dir = path
+        return _cookie_dir
+
+
+def _cookie_file(cookies_content: str) -> str:
+    """
+    Path of a cookies.txt holding cookies_content, written once and then reused.
+
+    yt-dlp saves the cookie jar back to this file when it closes, so each worker
+    thread gets its own copy: two extractions never share a file at the same time.
+    """
+    digest = hashlib.sha1(cookies_content.encode()).hexdigest()[:16]
+    path = _get_cookie_dir() / f"yt_cookies_{digest}_{threading.get_ident()}.txt"
+    if not path.exists():
+        tmp_path = path.with_suffix(".tmp")
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(cookies_content)
+        os.replace(tmp_path, path)
+    return str(path)
+
+
+def _load_cookies_env() -> Optional[str]:
+    cookies_content = os.environ.get("YOUTUBE_COOKIES")
+    if not cookies_content:
+        print("[YouTube] ❌ No YOUTUBE_COOKIES found in environment.")
+        return None
+    print("[YouTube] 🍪 Found YOUTUBE_COOKIES environment variable. loaded successfully.")
+    line_count = cookies_content.count('\n')
+    if line_count < 2:
+        # Naive fix for mangled secrets
+        cookies_content = cookies_content.replace(".youtube.com", "\n.youtube.com")
+        cookies_content = cookies_content.replace("# Netscape", "# Netscape")
+    return cookies_content
+
+
+# Credentials and client config come from the environment, which does not change
+# while the process runs: resolve them once at import instead of per request
+_COOKIES_CONTENT = _load_cookies_env()
+_PO_TOKEN = os.environ.get("YOUTUBE_PO_TOKEN")
+_VISITOR_DATA = os.environ.get("YOUTUBE_VISITOR_DATA")
+_PROXY_URL = os.environ.get("HTTP_PROXY")
+
+# Try to find ffmpeg path using imageio-ffmpeg if available (resolved once)
+try:
+    import imageio_ffmpeg
+    _FFMPEG_PATH: Optional[str] = imageio_ffmpeg.get_ffmpeg_exe()
+    print(f"[YouTube] Using ffmpeg from imageio-ffmpeg: {_FFMPEG_PATH}")
+except Exception:
+    # Fallback to system ffmpeg if not installed (or its binary is missing)
+    _FFMPEG_PATH = None
+
+# Fallback to PO Token & Visitor Data, used when there are no cookies (or the
+# cookie file cannot be written). Default robust clients for non-cookie requests
+_CLIENT_EXTRACTOR_ARGS: Dict[str, Any] = {
+    'youtube': {
+        'player_client': ['web', 'android', 'ios', 'mweb', 'tv'],
+        'player_skip': ['webpage', 'configs', 'js'],
+        'innertube_client': ['web', 'android'],
+    }
+}
+if _PO_TOKEN and _VISITOR_DATA:
+    print("[YouTube] 🛡️ Using PO Token and Visitor Data for authentication")
+    _CLIENT_EXTRACTOR_ARGS['youtube']['po_token'] = [f"web+{_VISITOR_DATA}+{_PO_TOKEN}"]
+
+if _COOKIES_CONTENT:
+    # When using cookies, avoid custom client overrides that might mismatch the session
+    # We trust yt-dlp defaults + cookies to behave like a browser
+    print("[YouTube] 🍪 Cookies present, skipping manual PO Token/Client Config to avoid session mismatch.")
 
 
 def _setup_ydl_opts(base_opts: Dict[str, Any]) -> Dict[str, Any]:
     """Helper to add cookies and client args to ydl_opts"""
     opts = base_opts.copy()
-    
-    # Check for Cookies First
-    has_cookies = False
-    try:
-        cookies_content = os.environ.get("YOUTUBE_COOKIES")
-        if cookies_content:
-            print("[YouTube] 🍪 Found YOUTUBE_COOKIES environment variable. loaded successfully.")
-            line_count = cookies_content.count('\n')
-            if line_count < 2:
-                # Naive fix for mangled secrets
-                cookies_content = cookies_content.replace(".youtube.com", "\n.youtube.com")
-                cookies_content = cookies_content.replace("# Netscape", "# Netscape")
-                
-            with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.txt') as cf:
-                cf.write(cookies_content)
-                opts['cookiefile'] = cf.name
-                has_cookies = True
-            
-            # When using cookies, avoid custom client overrides that might mismatch the session
-            # We trust yt-dlp defaults + cookies to behave like a browser
+    # Shared, never mutated: yt-dlp only reads extractor_args
+    opts['extractor_args'] = _CLIENT_EXTRACTOR_ARGS
+
+    if _COOKIES_CONTENT:
+        try:
+            opts['cookiefile'] = _cookie_file(_COOKIES_CONTENT)
             opts['extractor_args'] = {}
-            
-        else:
-            print("[YouTube] ❌ No YOUTUBE_COOKIES found in environment.")
-    except Exception as e:
-        print(f"[YouTube] ⚠️ Failed to setup cookies: {e}")
+        except Exception as e:
+            print(f"[YouTube] ⚠️ Failed to setup cookies, using client config: {e}")
 
-    # Fallback to PO Token & Visitor Data (Only if no cookies)
-    if not has_cookies:
-        po_token = os.environ.get("YOUTUBE_PO_TOKEN")
-        visitor_data = os.environ.get("YOUTUBE_VISITOR_DATA")
-        
-        # Default robust clients for non-cookie requests
-        opts['extractor_args'] = {
-            'youtube': {
-                'player_client': ['web', 'android', 'ios', 'mweb', 'tv'],
-                'player_skip': ['webpage', 'configs', 'js'],
-                'innertube_client': ['web', 'android'],
-            }
-        }
-        
-        if po_token and visitor_data:
-            print("[YouTube] 🛡️ Using PO Token and Visitor Data for authentication")
-            opts['extractor_args']['youtube']['po_token'] = [f"web+{visitor_data}+{po_token}"]
-            opts['extractor_args']['youtube']['player_client'] = ['web', 'android', 'ios', 'mweb', 'tv']
-    else:
-        print("[YouTube] 🍪 Cookies present, skipping manual PO Token/Client Config to avoid session mismatch.")
-        
     return opts
 
 
+# Video metadata cache: video_id -> (fetched_at, info), oldest first
+VIDEO_INFO_TTL = 600  # seconds
+VIDEO_INFO_CACHE_SIZE = 512
+_video_info_cache: "OrderedDict[str, tuple[float, Dict[str, Any]]]" = OrderedDict()
+_video_info_lock = threading.Lock()
+
+
+def _cached_video_info(video_id: str) -> Optional[Dict[str, Any]]:
+    with _video_info_lock:
+        entry = _video_info_cache.get(video_id)
+        if entry is None:
+            return None
+        if time.time() - entry[0] >= VIDEO_INFO_TTL:
+            del _video_info_cache[video_id]
+            return None
+        _video_info_cache.move_to_end(video_id)
+        return dict(entry[1])
+
+
+def _store_video_info(video_id: str, info: Dict[str, Any]):
+    with _video_info_lock:
+        _video_info_cache[video_id] = (time.time(), dict(info))
+        _video_info_cache.move_to_end(video_id)
+        if len(_video_info_cache) > VIDEO_INFO_CACHE_SIZE:
+            _video_info_cache.popitem(last=False)
+
+
 def get_video_info(url: str) -> Dict[str, Any]:
     """
     Get video metadata without downloading.
+
+    Results are cached per video ID for VIDEO_INFO_TTL seconds.
+    """
+    video_id = extract_video_id(url)
+    if not video_id:
+        raise ValueError("Invalid YouTube URL")
+
+    cached = _cached_video_info(video_id)
+    if cached is not None:
+        return cached
+
+    return _fetch_video_info(url, video_id)[1]
+
+
+def _fetch_video_info(url: str, video_id: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Run the yt-dlp extractor once.
+
+    Returns (raw_info, metadata): the raw info dict can be handed to
+    ydl.process_ie_result() to download without extracting again.
     """
     try:
         import yt_dlp
     except ImportError:
         raise RuntimeError("yt-dlp is not installed. Run: pip install yt-dlp")
     
-    video_id = extract_video_id(url)
-    if not video_id:
-        raise ValueError("Invalid YouTube URL")
-    
     ydl_opts = {
         'quiet': True,
         'no_warnings': True,
@@ -157,30 +311,59 @@ def get_video_info(url: str) -> Dict[str, Any]:
     with yt_dlp.YoutubeDL(ydl_opts) as ydl:
         try:
             info = ydl.extract_info(url, download=False)
-            # Clean up cookie if created
-            if 'cookiefile' in ydl_opts and os.path.exists(ydl_opts['cookiefile']):
-                try: 
-                    os.unlink(ydl_opts['cookiefile'])
-                except Exception: 
-                    pass
-
-            return {
+
+            result = {
                 'video_id': video_id,
                 'title': info.get('title', 'Unknown'),
                 'duration': info.get('duration', 0),
                 'thumbnail': info.get('thumbnail', f'https://img.youtube.com/vi/{video_id}/maxresdefault.jpg'),
                 'channel': info.get('channel', info.get('uploader', 'Unknown')),
             }
+            _store_video_info(video_id, result)
+            return info, result
         except Exception as e:
-            # Cleanup on error too
-            if 'cookiefile' in ydl_opts and os.path.exists(ydl_opts['cookiefile']):
-                try: 
-                    os.unlink(ydl_opts['cookiefile'])
-                except Exception: 
-                    pass
             raise RuntimeError(f"Failed to get video info step: {str(e)}")
 
 
+# Where extract_audio puts mp3s when the caller gives no output_dir
+DEFAULT_OUTPUT_DIR = Path(tempfile.gettempdir()) / "guitariz_youtube"
+
+# Concurrent downloads allowed per client IP, so a single client cannot tie up
+# every worker thread. Semaphores are only touched from the event loop.
+DOWNLOADS_PER_IP = 2
+_download_gates: Dict[str, list] = {}  # IP -> [semaphore, number of holders/waiters]
+
+# One download per video at a time: concurrent requests for the same video wait
+# for the first download and then hit the on-disk cache instead of racing on it.
+_download_locks: Dict[str, list] = {}  # video ID -> [lock, number of holders/waiters]
+_download_locks_guard = threading.Lock()
+
+
+@asynccontextmanager
+async def _sem_for(client_ip: str):
+    gate = _download_gates.get(client_ip)
+    if gate is None:
+        gate = _download_gates[client_ip] = [asyncio.Semaphore(DOWNLOADS_PER_IP), 0]
+    gate[1] += 1
+    try:
+        async with gate[0]:
+            yield
+    finally:
+        gate[1] -= 1
+        if gate[1] == 0:
+            del _download_gates[client_ip]
+
+
+async def extract_audio_async(url: str, client_ip: str, output_dir: Optional[Path] = None) -> Dict[str, Any]:
+    """Run extract_audio in a worker thread, at most DOWNLOADS_PER_IP at a time per client.
+
+    Uses Starlette's request threadpool rather than asyncio's small default
+    executor, which is left free for the DNS refresh.
+    """
+    async with _sem_for(client_ip):
+        return await run_in_threadpool(extract_audio, url, output_dir)
+
+
 def extract_audio(url: str, output_dir: Optional[Path] = None) -> Dict[str, Any]:
     """
     Download audio from YouTube URL.
@@ -192,18 +375,67 @@ def extract_audio(url: str, output_dir: Optional[Path] = None) -> Dict[str, Any]
     Returns:
         Dict with: audio_path, video_id, title, duration, thumbnail
     """
+    video_id = extract_video_id(url)
+    if not video_id:
+        raise ValueError("Invalid YouTube URL")
+
+    with _video_lock(video_id):
+        return _extract_audio(url, video_id, output_dir)
+
+
+@contextmanager
+def _video_lock(video_id: str):
+    """Hold the per-video download lock; the entry is dropped once nobody needs it."""
+    with _download_locks_guard:
+        entry = _download_locks.get(video_id)
+        if entry is None:
+            entry = _download_locks[video_id] = [threading.Lock(), 0]
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _download_locks_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _download_locks[video_id]
+
+
+def _extract_audio(url: str, video_id: str, output_dir: Optional[Path]) -> Dict[str, Any]:
     try:
         import yt_dlp
     except ImportError:
         raise RuntimeError("yt-dlp is not installed. Run: pip install yt-dlp")
+
+    # Create output directory
+    if output_dir is None:
+        output_dir = DEFAULT_OUTPUT_DIR
+    output_dir.mkdir(parents=True, exist_ok=True)
     
-    video_id = extract_video_id(url)
-    if not video_id:
-        raise ValueError("Invalid YouTube URL")
+    # Generate unique filename based on video ID
+    output_path = output_dir / f"{video_id}.mp3"
+    manifest_path = output_path.with_suffix(".json")
 
-    # Check duration limit (7 minutes)
+    # Already downloaded with its metadata alongside: no network needed at all
+    # (the duration limit was checked when it was first downloaded)
+    if output_path.exists():
+        manifest = _read_manifest(manifest_path)
+        if manifest is not None:
+            # Warm the info cache too, so get_video_info for this video needs no network
+            if _cached_video_info(video_id) is None and all(key in manifest for key in _MANIFEST_KEYS):
+                _store_video_info(video_id, {'video_id': video_id, **manifest})
+            _touch(output_path, manifest_path)
+            return _audio_result(output_path, video_id, manifest, cached=True)
+
+    # Check duration limit (7 minutes). The fetched metadata is reused for the result.
+    info: Dict[str, Any] = {}
+    raw_info = None
     try:
-        info = get_video_info(url)
+        cached_info = _cached_video_info(video_id)
+        if cached_info is not None:
+            info = cached_info
+        else:
+            raw_info, info = _fetch_video_info(url, video_id)
         duration = info.get('duration', 0)
         if duration > 420:  # 7 minutes * 60 seconds
             raise ValueError(f"Video is too long ({duration//60}:{duration%60:02d}). Maximum allowed duration is 7 minutes.")
@@ -215,39 +447,13 @@ def extract_audio(url: str, output_dir: Optional[Path] = None) -> Dict[str, Any]
         # For now, let's assume get_video_info works if extract_audio would work.
         print(f"[YouTube] Could not verify duration: {e}")
     
-    # Create output directory
-    if output_dir is None:
-        output_dir = Path(tempfile.gettempdir()) / "guitariz_youtube"
-    output_dir.mkdir(parents=True, exist_ok=True)
-    
-    # Generate unique filename based on video ID
-    output_path = output_dir / f"{video_id}.mp3"
-    
-    # Check if already downloaded (cache)
+    # Check if already downloaded (cache), e.g. by an older version without a manifest
     if output_path.exists():
-        # Get info without downloading again
-        info = get_video_info(url)
-        return {
-            'audio_path': str(output_path),
-            'video_id': video_id,
-            'title': info['title'],
-            'duration': info['duration'],
-            'thumbnail': info['thumbnail'],
-            'channel': info['channel'],
-            'cached': True,
-        }
+        _write_manifest(manifest_path, info)
+        _touch(output_path, manifest_path)
+        return _audio_result(output_path, video_id, info, cached=True)
     
     
-    # Try to find ffmpeg path using imageio-ffmpeg if available
-    ffmpeg_path = None
-    try:
-        import imageio_ffmpeg
-        ffmpeg_path = imageio_ffmpeg.get_ffmpeg_exe()
-        print(f"[YouTube] Using ffmpeg from imageio-ffmpeg: {ffmpeg_path}")
-    except ImportError:
-        # Fallback to system ffmpeg if not installed
-        pass
-
     ydl_opts = {
         'format': 'bestaudio/best',
         'outtmpl': str(output_dir / f'{video_id}.%(ext)s'),
@@ -263,20 +469,22 @@ def extract_audio(url: str, output_dir: Optional[Path] = None) -> Dict[str, Any]
     
     # Use helper for cookies & clients
     ydl_opts = _setup_ydl_opts(ydl_opts)
-    cookie_path = ydl_opts.get('cookiefile')
     
     # Proxy Support
-    proxy_url = os.environ.get("HTTP_PROXY")
-    if proxy_url:
-        ydl_opts['proxy'] = proxy_url
+    if _PROXY_URL:
+        ydl_opts['proxy'] = _PROXY_URL
 
-    if ffmpeg_path:
-        ydl_opts['ffmpeg_location'] = ffmpeg_path
+    if _FFMPEG_PATH:
+        ydl_opts['ffmpeg_location'] = _FFMPEG_PATH
     
     try:
         # Try yt-dlp first
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
+            if raw_info is not None:
+                # Reuse the info from the duration check instead of extracting again
+                ydl.process_ie_result(raw_info, download=True)
+            else:
+                ydl.download([url])
         
         # Verify file exists
         if not output_path.exists():
@@ -290,8 +498,8 @@ def extract_audio(url: str, output_dir: Optional[Path] = None) -> Dict[str, Any]
             from pytubefix import YouTube
             
             # Pass PO Token to pytubefix if available
-            po_token = os.environ.get("YOUTUBE_PO_TOKEN")
-            visitor_data = os.environ.get("YOUTUBE_VISITOR_DATA")
+            po_token = _PO_TOKEN
+            visitor_data = _VISITOR_DATA
             
             # Prepare kwargs
             yt_kwargs = {}
@@ -323,239 +531,407 @@ def extract_audio(url: str, output_dir: Optional[Path] = None) -> Dict[str, Any]
             if not stream:
                 raise RuntimeError("No stream found via pytubefix")
 
-            # Pytubefix output handling
-            downloaded_path = stream.download(output_path=str(output_dir), filename=f"{video_id}.mp4") 
-            
-            # Convert to mp3
-            print(f"[YouTube] Converting pytubefix output {downloaded_path} to {output_path}...")
-            subprocess.run([
-                'ffmpeg', '-y', '-i', downloaded_path, 
-                '-vn', '-acodec', 'libmp3lame', '-q:a', '2', 
-                str(output_path)
-            ], check=True, capture_output=True)
-            
-            # Cleanup raw extraction
-            Path(downloaded_path).unlink(missing_ok=True)
-            print(f"[YouTube] Audio extracted with pytubefix: {output_path}")
+            # Pytubefix output handling: the raw file is removed even if the
+            # download dies halfway, so partials never pile up on tmpfs
+            raw_path = _scratch_dir(output_dir) / f"{video_id}.mp4"
+            try:
+                downloaded_path = stream.download(output_path=str(raw_path.parent), filename=raw_path.name)
+
+                # Convert to mp3 (this also removes the raw extraction)
+                print(f"[YouTube] Converting pytubefix output {downloaded_path} to {output_path}...")
+                _transcode_to_mp3(Path(downloaded_path), output_path)
+                print(f"[YouTube] Audio extracted with pytubefix: {output_path}")
+            finally:
+                raw_path.unlink(missing_ok=True)
 
         except Exception as e_py:
             print(f"[YouTube] pytubefix also failed: {e_py}")
             
             # ---------------------------------------------------------
-            # FALLBACK 3: Invidious Instances (The "Hail Mary")
+            # FALLBACK 3: Invidious / Piped / Cobalt instances (the "Hail Mary"),
+            # raced in parallel so the worst case is one timeout, not their sum
             # ---------------------------------------------------------
-            print("[YouTube] Trying Invidious fallback (proxying)...")
-            invidious_instances = [
-                # Top tier (usually reliable)
-                "https://inv.tux.pizza",
-                "https://yt.artemislena.eu", 
-                "https://invidious.drgns.space",
-                
-                # Second tier
-                "https://invidious.flokinet.to",
-                "https://invidious.nerdvpn.de",
-                "https://inv.nadeko.net",
-                "https://yewtu.be",
-                
-                # Extra fallbacks
-                "https://invidious.io.lol",
-                "https://invidious.private.coffee",
-                "https://iv.ggtyler.dev",
-                "https://invidious.lunar.icu",
-            ]
-            
-            import requests
-            
-            success = False
-            
-            # --- Invidious Loop ---
-            for instance in invidious_instances:
-                try:
-                    # m4a audio itag=140
-                    download_url = f"{instance}/latest_version?id={video_id}&itag=140"
-                    print(f"[YouTube] Trying {instance}...")
-                    
-                    with requests.get(download_url, stream=True, timeout=15) as r:
-                         if r.status_code == 200:
-                             content_type = r.headers.get('Content-Type', '')
-                             if 'text/html' in content_type:
-                                 print(f"[YouTube] {instance} returned HTML. Skipping.")
-                                 continue
-                             
-                             temp_audio = output_dir / f"{video_id}.m4a"
-                             file_size = 0
-                             with open(temp_audio, 'wb') as f:
-                                 for chunk in r.iter_content(chunk_size=8192):
-                                     f.write(chunk)
-                                     file_size += len(chunk)
-                             
-                             if file_size < 10000:
-                                 print(f"[YouTube] {instance} too small ({file_size}b). Skipping.")
-                                 temp_audio.unlink(missing_ok=True)
-                                 continue
-
-                             print(f"[YouTube] Converting Invidious output {temp_audio} to {output_path}...")
-                             subprocess.run([
-                                 'ffmpeg', '-y', '-i', str(temp_audio), 
-                                 '-vn', '-acodec', 'libmp3lame', '-q:a', '2', 
-                                 str(output_path)
-                             ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                             
-                             temp_audio.unlink(missing_ok=True)
-                             print(f"[YouTube] Audio extracted via Invidious: {output_path}")
-                             success = True
-                             break
-                except Exception:
-                    print(f"[YouTube] {instance} failed")
-
-            # --- Piped Fallback (If Invidious fails) ---
-            if not success:
-                 print("[YouTube] Invidious failed. Trying Piped API fallback...")
-                 piped_instances = [
-                     "https://pipedapi.kavin.rocks",
-                     "https://api.piped.privacy.com.de",
-                     "https://pipedapi.drgns.space",
-                     "https://api.piped.yt",
-                     "https://pipedapi.tokhmi.xyz", 
-                     "https://piped-api.lunar.icu",
-                 ]
-                 
-                 for api_base in piped_instances:
-                     try:
-                         print(f"[YouTube] Trying Piped API: {api_base}...")
-                         # Get video streams
-                         resp = requests.get(f"{api_base}/streams/{video_id}", timeout=10)
-                         if resp.status_code != 200:
-                             print(f"[YouTube] Piped {api_base} returned {resp.status_code}")
-                             continue
-                         
-                         data = resp.json()
-                         audio_streams = data.get('audioStreams', [])
-                         # Find m4a stream
-                         target_stream = next((s for s in audio_streams if s.get('format') == 'M4A'), None)
-                         if not target_stream and audio_streams:
-                             target_stream = audio_streams[0] # Fallback to any
-                             
-                         if target_stream:
-                             stream_url = target_stream['url']
-                             print("[YouTube] Downloading from Piped stream...")
-                             
-                             # Download the stream
-                             with requests.get(stream_url, stream=True, timeout=20) as r_stream:
-                                 if r_stream.status_code == 200:
-                                     temp_audio = output_dir / f"{video_id}_piped.m4a"
-                                     with open(temp_audio, 'wb') as f:
-                                         for chunk in r_stream.iter_content(chunk_size=8192):
-                                             f.write(chunk)
-                                     
-                                     # Convert
-                                     print("[YouTube] Converting Piped output...")
-                                     subprocess.run([
-                                        'ffmpeg', '-y', '-i', str(temp_audio), 
-                                        '-vn', '-acodec', 'libmp3lame', '-q:a', '2', 
-                                        str(output_path)
-                                     ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                                     
-                                     temp_audio.unlink(missing_ok=True)
-                                     success = True
-                                     break
-                     except Exception as e_piped:
-                         print(f"[YouTube] Piped {api_base} failed: {e_piped}")
-
-            # --- Cobalt Fallback (The Professional Downloader) ---
-            if not success:
-                 print("[YouTube] Piped failed. Trying Cobalt API fallback...")
-                 cobalt_instances = [
-                     "https://cobalt.git.gay",
-                     "https://cobalt.maybreak.com",
-                     "https://cobalt.tools",
-                     "https://api.cobalt.tools", 
-                     "https://cobalt.api.kwiatekmiki.pl",
-                 ]
-                 
-                 for api_base in cobalt_instances:
-                     try:
-                         print(f"[YouTube] Trying Cobalt API: {api_base}...")
-                         headers = {
-                             "Accept": "application/json",
-                             "Content-Type": "application/json",
-                             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-                         }
-                         
-                         # Try v10 payload first (POST /)
-                         payload_v10 = {
-                             "url": f"https://www.youtube.com/watch?v={video_id}",
-                             "downloadMode": "audio",
-                             "audioFormat": "mp3"
-                         }
-                         
-                         try:
-                             resp = requests.post(f"{api_base}/", json=payload_v10, headers=headers, timeout=15)
-                             if resp.status_code == 200:
-                                 data = resp.json()
-                                 download_url = data.get('url')
-                                 if download_url:
-                                     # Success with v10
-                                     pass 
-                                 else:
-                                     # Try v7 payload (POST /api/json)
-                                     raise ValueError("v10 failed")
-                             else:
-                                 raise ValueError(f"v10 returned {resp.status_code}")
-                         except Exception:
-                             # Fallback to v7 style
-                             payload_v7 = {
-                                 "url": f"https://www.youtube.com/watch?v={video_id}",
-                                 "isAudioOnly": True,
-                                 "aFormat": "mp3"
-                             }
-                             resp = requests.post(f"{api_base}/api/json", json=payload_v7, headers=headers, timeout=15)
-                             if resp.status_code != 200:
-                                 print(f"[YouTube] Cobalt {api_base} returned {resp.status_code}: {resp.text}")
-                                 continue
-                             data = resp.json()
-                             download_url = data.get('url')
-
-                         if download_url:
-                             print("[YouTube] Downloading from Cobalt stream...")
-                             with requests.get(download_url, stream=True, timeout=30) as r_stream:
-                                 if r_stream.status_code == 200:
-                                     temp_audio = output_dir / f"{video_id}_cobalt.mp3"
-                                     with open(temp_audio, 'wb') as f:
-                                         for chunk in r_stream.iter_content(chunk_size=8192):
-                                             f.write(chunk)
-                                     
-                                     if temp_audio.stat().st_size < 10000:
-                                          print("[YouTube] Cobalt download too small.")
-                                          temp_audio.unlink(missing_ok=True)
-                                          continue
-
-                                     subprocess.run([
-                                        'ffmpeg', '-y', '-i', str(temp_audio), 
-                                        '-vn', '-acodec', 'libmp3lame', '-q:a', '2', 
-                                        str(output_path)
-                                     ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                                     
-                                     temp_audio.unlink(missing_ok=True)
-                                     success = True
-                                     break
-                         else:
-                             print(f"[YouTube] Cobalt response missing url: {data}")
-                             
-                     except Exception as e_cobalt:
-                         print(f"[YouTube] Cobalt {api_base} failed: {e_cobalt}")
-
-            if not success:
+            print("[YouTube] Trying Invidious/Piped/Cobalt fallbacks (proxying)...")
+            temp_audio = _race_fallbacks(video_id, _scratch_dir(output_dir))
+            if temp_audio is None:
                 raise RuntimeError("All methods failed (yt-dlp, pytubefix, Invidious/Piped/Cobalt). Running in Datacenter? IP is heavily blocked.")
 
+            print(f"[YouTube] Converting fallback output {temp_audio} to {output_path}...")
+            _transcode_to_mp3(temp_audio, output_path)
+            print(f"[YouTube] Audio extracted via fallback: {output_path}")
+
+    _write_manifest(manifest_path, info)
+    return _audio_result(output_path, video_id, info, cached=False)
+
+
+# ---------------------------------------------------------
+# Proxy fallbacks, used when yt-dlp and pytubefix are both blocked
+# ---------------------------------------------------------
+INVIDIOUS_INSTANCES = [
+    # Top tier (usually reliable)
+    "https://inv.tux.pizza",
+    "https://yt.artemislena.eu", 
+    "https://invidious.drgns.space",
+    
+    # Second tier
+    "https://invidious.flokinet.to",
+    "https://invidious.nerdvpn.de",
+    "https://inv.nadeko.net",
+    "https://yewtu.be",
+    
+    # Extra fallbacks
+    "https://invidious.io.lol",
+    "https://invidious.private.coffee",
+    "https://iv.ggtyler.dev",
+    "https://invidious.lunar.icu",
+]
+
+PIPED_INSTANCES = [
+    "https://pipedapi.kavin.rocks",
+    "https://api.piped.privacy.com.de",
+    "https://pipedapi.drgns.space",
+    "https://api.piped.yt",
+    "https://pipedapi.tokhmi.xyz", 
+    "https://piped-api.lunar.icu",
+]
+
+COBALT_INSTANCES = [
+    "https://cobalt.git.gay",
+    "https://cobalt.maybreak.com",
+    "https://cobalt.tools",
+    "https://api.cobalt.tools", 
+    "https://cobalt.api.kwiatekmiki.pl",
+]
+
+COBALT_HEADERS = {
+    "Accept": "application/json",
+    "Content-Type": "application/json",
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+}
+
+FALLBACK_CONCURRENCY = 8  # instances contacted at once; submission order is preference order
+FALLBACK_RACE_TIMEOUT = 120  # seconds for the whole race; httpx timeouts are per read
+MIN_AUDIO_BYTES = 10000  # anything smaller is an error page, not audio
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# All fallback HTTP runs as asyncio tasks on one background event loop, so the
+# whole race is multiplexed on a single thread and losers are simply cancelled.
+# The client lives on that loop for the life of the process and keeps
+# connections to the instances pooled across requests.
+_fallback_loop: Optional[asyncio.AbstractEventLoop] = None
+_fallback_client: Optional[httpx.AsyncClient] = None
+_fallback_loop_lock = threading.Lock()
+
+
+def _get_fallback_loop() -> asyncio.AbstractEventLoop:
+    global _fallback_loop, _fallback_client
+    with _fallback_loop_lock:
+        if _fallback_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="yt-fallback", daemon=True).start()
+            _fallback_client = httpx.AsyncClient(
+                headers={"User-Agent": COBALT_HEADERS["User-Agent"]},
+                # limits must go on the transport: the client ignores them when given one
+                transport=httpx.AsyncHTTPTransport(
+                    retries=1,
+                    limits=httpx.Limits(max_connections=32, max_keepalive_connections=32),
+                ),
+                follow_redirects=True,
+            )
+            _fallback_loop = loop
+        return _fallback_loop
+
+
+# Circuit breaker: instances that just failed sit out a cooldown that doubles
+# with each consecutive failure; instances that worked recently are tried first
+INSTANCE_COOLDOWN_BASE = 15  # seconds
+INSTANCE_COOLDOWN_MAX = 300
+_instance_health: Dict[str, Dict[str, float]] = {}  # base URL -> cooldown_until, failures, last_success
+_instance_health_lock = threading.Lock()
+
+
+def _record_attempt(base: str, task):
+    """Done-callback for every fallback attempt: update the instance's health."""
+    if task.cancelled():
+        return  # lost the race; not the instance's fault
+    error = task.exception()
+    now = time.time()
+    with _instance_health_lock:
+        health = _instance_health.setdefault(base, {'cooldown_until': 0.0, 'failures': 0, 'last_success': 0.0})
+        if error is None:
+            health['failures'] = 0
+            health['cooldown_until'] = 0.0
+            health['last_success'] = now
+        else:
+            health['failures'] += 1
+            cooldown = INSTANCE_COOLDOWN_BASE * 2 ** (health['failures'] - 1)
+            health['cooldown_until'] = now + min(INSTANCE_COOLDOWN_MAX, cooldown)
+
+
+def _order_attempts(attempts: list) -> list:
+    """Drop instances in cooldown and put recently successful ones first (stable otherwise)."""
+    now = time.time()
+    with _instance_health_lock:
+        health = {base: dict(h) for base, h in _instance_health.items()}
+    available = [a for a in attempts if health.get(a[1], {}).get('cooldown_until', 0.0) <= now]
+    if not available:
+        # Everything is cooling down: trying them all beats failing outright
+        available = attempts
+    return sorted(available, key=lambda a: -health.get(a[1], {}).get('last_success', 0.0))
+
+
+async def _download_stream(client: httpx.AsyncClient, url: str, dest: Path, timeout: float) -> Path:
+    """Stream url to dest in 1 MiB chunks, rejecting HTML and tiny bodies."""
+    async with client.stream("GET", url, timeout=timeout) as r:
+        if r.status_code != 200:
+            raise RuntimeError(f"returned {r.status_code}")
+        if 'text/html' in r.headers.get('Content-Type', ''):
+            raise RuntimeError("returned HTML")
+        try:
+            with open(dest, 'wb') as f:
+                async for chunk in r.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                file_size = f.tell()
+            if file_size < MIN_AUDIO_BYTES:
+                raise RuntimeError(f"too small ({file_size}b)")
+        except BaseException:
+            # Also runs when the task is cancelled because another instance won
+            dest.unlink(missing_ok=True)
+            raise
+    return dest
+
+
+async def _fetch_invidious(client: httpx.AsyncClient, instance: str, video_id: str, dest: Path) -> Path:
+    # m4a audio itag=140
+    url = f"{instance}/latest_version?id={video_id}&itag=140"
+    # Cheap HEAD first: dead instances answer with an error or an HTML page, and
+    # we learn that without opening a download. Live ones redirect to the
+    # stream, which is then fetched from the final URL directly.
+    head = await client.head(url, timeout=5)
+    content_type = head.headers.get('Content-Type', '')
+    if head.status_code != 200:
+        raise RuntimeError(f"HEAD returned {head.status_code}")
+    if 'audio' not in content_type and content_type != 'application/octet-stream':
+        raise RuntimeError(f"HEAD returned {content_type or 'no content type'}")
+    return await _download_stream(client, str(head.url), dest, 15)
+
+
+async def _fetch_piped(client: httpx.AsyncClient, api_base: str, video_id: str, dest: Path) -> Path:
+    # Get video streams
+    resp = await client.get(f"{api_base}/streams/{video_id}", timeout=10)
+    if resp.status_code != 200:
+        raise RuntimeError(f"returned {resp.status_code}")
+
+    audio_streams = orjson.loads(resp.content).get('audioStreams', [])
+    # Find m4a stream
+    target_stream = next((s for s in audio_streams if s.get('format') == 'M4A'), None)
+    if not target_stream and audio_streams:
+        target_stream = audio_streams[0] # Fallback to any
+    if not target_stream:
+        raise RuntimeError("no audio streams")
+
+    return await _download_stream(client, target_stream['url'], dest, 20)
+
+
+async def _fetch_cobalt(client: httpx.AsyncClient, api_base: str, video_id: str, dest: Path) -> Path:
+    # Try v10 payload first (POST /)
+    payload_v10 = {
+        "url": f"https://www.youtube.com/watch?v={video_id}",
+        "downloadMode": "audio",
+        "audioFormat": "mp3"
+    }
+    download_url = None
+    try:
+        resp = await client.post(f"{api_base}/", json=payload_v10, headers=COBALT_HEADERS, timeout=15)
+        if resp.status_code == 200:
+            download_url = orjson.loads(resp.content).get('url')
+    except Exception:
+        pass
+
+    if not download_url:
+        # Fallback to v7 style (POST /api/json)
+        payload_v7 = {
+            "url": f"https://www.youtube.com/watch?v={video_id}",
+            "isAudioOnly": True,
+            "aFormat": "mp3"
+        }
+        resp = await client.post(f"{api_base}/api/json", json=payload_v7, headers=COBALT_HEADERS, timeout=15)
+        if resp.status_code != 200:
+            raise RuntimeError(f"returned {resp.status_code}: {resp.text}")
+        data = orjson.loads(resp.content)
+        download_url = data.get('url')
+        if not download_url:
+            raise RuntimeError(f"response missing url: {data}")
+
+    return await _download_stream(client, download_url, dest, 30)
+
+
+def _race_fallbacks(video_id: str, scratch_dir: Path) -> Optional[Path]:
+    """
+    Ask every Invidious, Piped and Cobalt instance not in cooldown for the audio at
+    once and keep the first complete download. Returns its temp path, or None if
+    all failed or nothing finished within FALLBACK_RACE_TIMEOUT.
+    """
+    loop = _get_fallback_loop()
+    race = asyncio.wait_for(_race_fallbacks_async(video_id, scratch_dir), FALLBACK_RACE_TIMEOUT)
+    try:
+        return asyncio.run_coroutine_threadsafe(race, loop).result()
+    except asyncio.TimeoutError:
+        print(f"[YouTube] Fallback race timed out after {FALLBACK_RACE_TIMEOUT}s")
+        return None
+
+
+async def _race_fallbacks_async(video_id: str, scratch_dir: Path) -> Optional[Path]:
+    attempts = _order_attempts(
+        [("Invidious", base, _fetch_invidious, "m4a") for base in INVIDIOUS_INSTANCES]
+        + [("Piped", base, _fetch_piped, "m4a") for base in PIPED_INSTANCES]
+        + [("Cobalt", base, _fetch_cobalt, "mp3") for base in COBALT_INSTANCES]
+    )
+    slots = asyncio.Semaphore(FALLBACK_CONCURRENCY)
+
+    async def attempt(fetch, base, dest):
+        async with slots:
+            return await fetch(_fallback_client, base, video_id, dest)
+
+    tasks = {}
+    for i, (kind, base, fetch, ext) in enumerate(attempts):
+        task = asyncio.create_task(attempt(fetch, base, scratch_dir / f"{video_id}_fallback{i}.{ext}"))
+        task.add_done_callback(partial(_record_attempt, base))
+        tasks[task] = f"{kind} {base}"
+
+    winner = None
+    try:
+        pending = set(tasks)
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    print(f"[YouTube] {tasks[task]} failed: {task.exception()}")
+                    continue
+                winner = task
+                print(f"[YouTube] Downloaded via {tasks[task]}")
+                break
     finally:
-        # Cleanup cookie file
-        if cookie_path and os.path.exists(cookie_path):
-            try:
-                os.unlink(cookie_path)
-            except Exception:
-                pass
+        # Cancel the rest (their partial files are removed as they unwind) and
+        # delete anything that completed in the same batch as the winner
+        losers = [task for task in tasks if task is not winner]
+        for task in losers:
+            task.cancel()
+        await asyncio.gather(*losers, return_exceptions=True)
+        for task in losers:
+            if not task.cancelled() and task.exception() is None:
+                task.result().unlink(missing_ok=True)
+    return winner.result() if winner is not None else None
+
+
+# Raw fallback downloads only live until ffmpeg has read them, so they go to
+# tmpfs when it has room: the intermediate file is never written to disk.
+# The mp3 itself still goes to output_dir. Our own subdirectory keeps the
+# leftover sweep away from anything else living in /dev/shm.
+SCRATCH_DIR = Path("/dev/shm") / "guitariz_youtube"
+SCRATCH_MIN_FREE = 256 * 1024 * 1024
+
+
+def _scratch_dir(output_dir: Path) -> Path:
+    """SCRATCH_DIR if tmpfs exists and has SCRATCH_MIN_FREE bytes free, else output_dir."""
+    try:
+        st = os.statvfs(SCRATCH_DIR.parent)
+    except (OSError, AttributeError):  # missing, or no statvfs (Windows)
+        return output_dir
+    if st.f_bavail * st.f_frsize < SCRATCH_MIN_FREE:
+        return output_dir
+    try:
+        SCRATCH_DIR.mkdir(mode=0o700, exist_ok=True)
+    except OSError:
+        return output_dir
+    return SCRATCH_DIR
+
+
+# ffmpeg transcodes are CPU-bound: they share a pool sized to the machine, so
+# concurrent requests keep downloading while at most one encode per core runs
+_FFMPEG_POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 2, thread_name_prefix="ffmpeg")
+
+
+def _is_mp3(path: Path) -> bool:
+    """True if the file starts with an ID3 tag or an MPEG Layer III frame header."""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(3)
+    except OSError:
+        return False
+    if head == b'ID3':
+        return True
+    # 11-bit frame sync plus layer bits 01 (Layer III); rules out AAC/ADTS (layer 00)
+    return len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE6 == 0xE2
+
+
+def _transcode_to_mp3(src: Path, dst: Path):
+    """Convert a downloaded stream to mp3 on the ffmpeg pool, then remove the source."""
+    if _is_mp3(src):
+        # Already mp3 (Cobalt transcodes server-side): just move it into place
+        # (a copy when src is on tmpfs)
+        shutil.move(src, dst)
+        return
+
+    # VBR ~190 kbps as before; compression_level 7 selects LAME's faster
+    # psychoacoustic search, a quality trade-off the chord analysis cannot hear
+    future = _FFMPEG_POOL.submit(_run_ffmpeg, [
+        '-i', str(src), '-vn', '-acodec', 'libmp3lame', '-q:a', '2',
+        '-compression_level', '7', str(dst),
+    ])
+    try:
+        future.result()
+    finally:
+        src.unlink(missing_ok=True)
+
+
+def _run_ffmpeg(args: list):
+    """Run one ffmpeg job. Only errors are captured; stdin and stdout stay detached."""
+    proc = subprocess.run(
+        [_FFMPEG_PATH or 'ffmpeg', '-nostdin', '-hide_banner', '-loglevel', 'error', '-y', *args],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    if proc.returncode != 0:
+        detail = proc.stderr.decode(errors='replace').strip()[-500:]
+        raise RuntimeError(f"ffmpeg exited with {proc.returncode}: {detail}")
 
+
+_MANIFEST_KEYS = ('title', 'duration', 'thumbnail', 'channel')
+
+
+def _read_manifest(manifest_path: Path) -> Optional[Dict[str, Any]]:
+    """Load the metadata sidecar written next to a downloaded mp3, if present and valid."""
+    try:
+        return json.loads(manifest_path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(manifest_path: Path, info: Dict[str, Any]):
+    """Store video metadata next to its mp3 so later cache hits skip yt-dlp."""
+    if not info:
+        return
+    manifest = {key: info[key] for key in _MANIFEST_KEYS if key in info}
+    # Write then rename, so readers never see a half-written sidecar
+    tmp_path = manifest_path.with_suffix(".json.tmp")
+    try:
+        tmp_path.write_text(json.dumps(manifest))
+        os.replace(tmp_path, manifest_path)
+    except OSError as e:
+        tmp_path.unlink(missing_ok=True)
+        print(f"[YouTube] Could not write manifest {manifest_path}: {e}")
+
+
+def _touch(*paths: Path):
+    """Bump mtimes on a cache hit so cleanup_old_files ages files from their last use."""
+    for path in paths:
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+
+def _audio_result(output_path: Path, video_id: str, info: Dict[str, Any], cached: bool) -> Dict[str, Any]:
     return {
         'audio_path': str(output_path),
         'video_id': video_id,
@@ -563,21 +939,59 @@ def extract_audio(url: str, output_dir: Optional[Path] = None) -> Dict[str, Any]
         'duration': info.get('duration', 0),
         'thumbnail': info.get('thumbnail', f'https://img.youtube.com/vi/{video_id}/maxresdefault.jpg'),
         'channel': info.get('channel', info.get('uploader', 'Unknown')),
-        'cached': False,
+        'cached': cached,
     }
 
 
 def cleanup_old_files(directory: Path, max_age_hours: int = 24):
-    """Remove audio files older than max_age_hours."""
+    """
+    Remove audio files (and their metadata manifests) not used for max_age_hours,
+    plus partial downloads and manifests left behind by interrupted requests.
+    """
     if not directory.exists():
         return
     
     now = time.time()
     max_age_seconds = max_age_hours * 3600
     
-    for file in directory.glob("*.mp3"):
-        if now - file.stat().st_mtime > max_age_seconds:
+    # DirEntry carries what the directory read already returned, so this avoids
+    # a separate path lookup per file
+    with os.scandir(directory) as it:
+        for entry in it:
+            name = entry.name
+            is_audio = name.endswith(".mp3")
+            is_leftover = "_fallback" in name or name.endswith((".json.tmp", ".mp4"))
+            if not (is_audio or is_leftover):
+                continue
             try:
-                file.unlink()
-            except Exception:
+                if now - entry.stat().st_mtime <= max_age_seconds:
+                    continue
+                if is_audio:
+                    # Under the video's download lock, and re-checked there: an
+                    # extraction in flight may be serving (and touching) this file
+                    path = Path(entry.path)
+                    with _video_lock(path.stem):
+                        if time.time() - path.stat().st_mtime > max_age_seconds:
+                            path.unlink()
+                            path.with_suffix(".json").unlink(missing_ok=True)
+                else:
+                    os.unlink(entry.path)
+            except OSError:
                 pass  # Ignore errors during cleanup
+
+
+# Downloads expire after a day; raw scratch files normally live for seconds,
+# so anything over an hour old there was orphaned by a crash or a kill
+DOWNLOAD_SWEEP_INTERVAL = 600  # seconds
+SCRATCH_MAX_AGE_HOURS = 1
+
+
+def download_cleanup_loop():
+    """Background loop that expires old downloads and sweeps scratch leftovers."""
+    while True:
+        try:
+            cleanup_old_files(DEFAULT_OUTPUT_DIR)
+            cleanup_old_files(SCRATCH_DIR, max_age_hours=SCRATCH_MAX_AGE_HOURS)
+        except Exception as e:
+            print(f"[YouTube] Download cleanup error: {e}")
+        time.sleep(DOWNLOAD_SWEEP_INTERVAL)
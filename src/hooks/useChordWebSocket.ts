@@ -19,6 +19,7 @@ interface WebSocketMessage {
 }
 
 const BACKEND_WS_URL = import.meta.env.VITE_BACKEND_WS_URL || "ws://localhost:7860";
+const AUDIO_FRAME_HEADER_BYTES = 8;
 
 export const useChordWebSocket = () => {
     const [isConnected, setIsConnected] = useState(false);
@@ -120,15 +121,12 @@ export const useChordWebSocket = () => {
                 pcmData[i] = s < 0 ? s * 0x8000 : s * 0x7FFF;
             }
 
-            // Convert to base64
-            const bytes = new Uint8Array(pcmData.buffer);
-            const base64 = btoa(String.fromCharCode(...bytes));
+            // Binary frame: float64 LE timestamp header followed by the raw PCM samples
+            const frame = new ArrayBuffer(AUDIO_FRAME_HEADER_BYTES + pcmData.byteLength);
+            new DataView(frame).setFloat64(0, timestamp, true);
+            new Int16Array(frame, AUDIO_FRAME_HEADER_BYTES).set(pcmData);
 
-            wsRef.current.send(JSON.stringify({
-                type: "audio_chunk",
-                data: base64,
-                timestamp,
-            }));
+            wsRef.current.send(frame);
 
             return true;
         } catch (e) {